@@ -0,0 +1,172 @@
+import io
+import json
+import os
+import time
+from types import SimpleNamespace
+
+import profiling
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+# Statuses after which a batch does not change anymore
+FINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+
+class BatchRunner:
+    """
+    Runs the requests of a filter step as one OpenAI Batch API job instead of interactive chat
+    calls: the requests are written as JSONL, uploaded, submitted and polled until the batch is
+    done (half the price of chat calls and no per-minute rate limits, but results can take up
+    to the 24h completion window).
+
+    Every request gets a custom id ("step3_interest-00042"); while a batch runs, the state file
+    keeps its batch id and maps each custom id to the job ids in its prompt. Answers are handed
+    to on_answer as they are collected, so the caller can checkpoint them by job id. A run that
+    is interrupted (Ctrl+C, crash, closed laptop) collects the submitted batch on the next run
+    (resume) instead of resubmitting it, even if the jobs to filter changed in between. Requests
+    the batch could not answer (errors, expired window) are resubmitted as a new batch.
+    """
+
+    def __init__(self, client, model, state_path="data/batch_state.json", poll_interval=60.0, max_rounds=3):
+        """
+        client: OpenAI client (any OpenAI-compatible endpoint with the files and batches API)
+        state_path: JSON state file for resuming
+        poll_interval: seconds between two status checks of a running batch
+        max_rounds: batches submitted per step and run before unanswered requests are given up on
+        """
+        self.client = client
+        self.model = model
+        self.state_path = state_path
+        self.poll_interval = poll_interval
+        self.max_rounds = max_rounds
+        self.state = self._load_state()
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _save_state(self):
+        os.makedirs(os.path.dirname(self.state_path) or '.', exist_ok=True)
+        # Written to a temporary file first, so an interruption never leaves a half-written state
+        with open(self.state_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+        os.replace(self.state_path + '.tmp', self.state_path)
+
+    def resume(self, step, run_key, on_answer):
+        """
+        Collect the batch an interrupted run submitted for step under run_key (the filter config),
+        calling on_answer(job_ids, content) for every answered request. Does nothing if there is none.
+        """
+        state_key = f"{step}@{run_key}"
+        entry = self.state.get(state_key)
+        if entry is None:
+            return
+        print(f"Collecting batch {entry['batch_id']} submitted by an interrupted run.")
+        batch = self._wait(entry['batch_id'])
+        answered = self._collect(step, batch, entry['job_ids'], on_answer)
+        print(f"Batch {batch.id} {batch.status}: {len(answered)} of {len(entry['job_ids'])} requests answered.")
+        # Unanswered jobs are sent again by the caller, with the current batching
+        del self.state[state_key]
+        self._save_state()
+
+    def run(self, step, run_key, requests, job_ids, on_answer):
+        """
+        Answer requests, a list of (system_prompt, prompt_message), through the Batch API.
+        job_ids: per request, the ids of the jobs in its prompt, in prompt order.
+        on_answer(job_ids, content) is called with the response text of every answered request.
+        Raises RuntimeError if a batch fails or requests are still unanswered after max_rounds
+        batches; the answers collected before are kept by on_answer.
+        """
+        state_key = f"{step}@{run_key}"
+        pending = {f"{step}-{n:05d}": n for n in range(len(requests))}
+        rounds = 0
+        while pending:
+            if rounds >= self.max_rounds:
+                raise RuntimeError(f"{len(pending)} {step} requests were not answered after {rounds} batches")
+            batch_id = self._submit(step, [(custom_id, requests[n]) for custom_id, n in pending.items()])
+            rounds += 1
+            self.state[state_key] = {'batch_id': batch_id, 'job_ids': {custom_id: job_ids[n] for custom_id, n in pending.items()}}
+            self._save_state()
+            batch = self._wait(batch_id)
+            answered = self._collect(step, batch, self.state[state_key]['job_ids'], on_answer)
+            print(f"Batch {batch.id} {batch.status}: {len(answered)} of {len(pending)} requests answered.")
+            for custom_id in answered:
+                del pending[custom_id]
+            # The answers are with the caller now; a rerun starts from its checkpoints
+            del self.state[state_key]
+            self._save_state()
+            if batch.status == 'failed':
+                raise RuntimeError(f"Batch {batch.id} for {step} failed: {getattr(batch, 'errors', None)}")
+
+    def _submit(self, step, requests):
+        lines = []
+        for custom_id, (system_prompt, prompt_message) in requests:
+            lines.append(json.dumps({
+                'custom_id': custom_id,
+                'method': 'POST',
+                'url': BATCH_ENDPOINT,
+                'body': {
+                    'model': self.model,
+                    'messages': [
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": prompt_message}
+                    ]
+                }
+            }, ensure_ascii=False))
+        content = ("\n".join(lines) + "\n").encode('utf-8')
+        input_file = self.client.files.create(file=(f"{step}.jsonl", io.BytesIO(content)), purpose="batch")
+        batch = self.client.batches.create(input_file_id=input_file.id, endpoint=BATCH_ENDPOINT, completion_window="24h",
+                                           metadata={'step': step})
+        print(f"Submitted {len(requests)} {step} requests as batch {batch.id} ({len(content) / 1024:.0f} KB).")
+        return batch.id
+
+    def _wait(self, batch_id):
+        start = time.perf_counter()
+        last_status = None
+        while True:
+            batch = self.client.batches.retrieve(batch_id)
+            counts = batch.request_counts
+            status = (batch.status, counts.completed if counts else None)
+            if status != last_status:
+                done = f", {counts.completed + counts.failed} of {counts.total} requests done" if counts and counts.total else ""
+                print(f"Batch {batch_id}: {batch.status}{done}")
+                last_status = status
+            if batch.status in FINAL_STATUSES:
+                profiling.observe("openai.batch", time.perf_counter() - start)
+                return batch
+            time.sleep(self.poll_interval)
+
+    def _collect(self, step, batch, job_ids, on_answer):
+        """
+        Hand the answers of a finished batch to on_answer(job_ids[custom_id], content); returns
+        the custom ids that were answered.
+        """
+        answered = []
+        errors = 0
+        if batch.output_file_id:
+            for line in self.client.files.content(batch.output_file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                result = json.loads(line)
+                response = result.get('response') or {}
+                if result.get('custom_id') not in job_ids or response.get('status_code') != 200:
+                    errors += 1
+                    continue
+                body = response['body']
+                on_answer(job_ids[result['custom_id']], body['choices'][0]['message']['content'])
+                usage = body.get('usage')
+                profiling.add_usage(step, SimpleNamespace(**usage) if usage else None)
+                answered.append(result['custom_id'])
+        if batch.error_file_id:
+            errors += sum(1 for line in self.client.files.content(batch.error_file_id).text.splitlines() if line.strip())
+        if errors:
+            print(f"Batch {batch.id}: {errors} requests failed and will be resubmitted.")
+        return answered
+
+    def finish(self):
+        """Remove the state file once all steps are done and their verdicts are stored."""
+        self.state = {}
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
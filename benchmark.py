@@ -0,0 +1,336 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from selenium.webdriver.common.by import By
+
+from database import initialize_database
+from descriptions import BOILERPLATE_SELECTOR
+from scraper import (initialize_driver, handle_cookies, read_job_cards, get_page_url,
+                     scrape_jobs_from_stepstone, DESCRIPTION_SCRIPT)
+from gpt_filter import filter_jobs_by_interest
+from mock_openai import start_mock_server
+from browser_pool import BrowserPool
+from detail_fetcher import DetailFetcher
+from ingest import JobWriter
+from page_waits import PageTimings
+from replay import ReplayServer
+
+
+def make_synthetic_jobs(count, description_length=1500):
+    """Create fake job dicts shaped like the rows main() passes to the filter."""
+    filler = "We are looking for a motivated colleague to join our remote team. "
+    description = (filler * (description_length // len(filler) + 1))[:description_length]
+    return [
+        {'id': i + 1, 'title': f"Python Developer {i + 1} (m/w/d)", 'description': description, 'company': f"Company {i % 50}"}
+        for i in range(count)
+    ]
+
+
+def benchmark_filter(job_count, concurrency_levels, latency, requests_per_minute=None, tokens_per_minute=None):
+    """Measure filter throughput against a local mock OpenAI endpoint for each concurrency level."""
+    server = start_mock_server(latency=latency)
+    print(f"Mock OpenAI endpoint at {server.base_url} ({latency:.2f}s latency per request)")
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cwd = os.getcwd()
+        os.chdir(tmp_dir)  # Prompt dumps are written to the working directory
+        try:
+            for concurrency in concurrency_levels:
+                db_path = os.path.join(tmp_dir, f"bench_{concurrency}.db")
+                initialize_database(db_path)
+                jobs = make_synthetic_jobs(job_count)
+                requests_before = server.request_count
+                start = time.perf_counter()
+                filter_jobs_by_interest("mock-key", jobs, ["python"], ["senior"], homeoffice_required=True,
+                                        db_path=db_path, concurrency=concurrency,
+                                        requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute,
+                                        base_url=server.base_url)
+                elapsed = time.perf_counter() - start
+                requests = server.request_count - requests_before
+                results.append((concurrency, requests, elapsed))
+        finally:
+            os.chdir(cwd)
+    server.shutdown()
+
+    print(f"\nFilter throughput for {job_count} jobs:")
+    print(f"{'concurrency':>12} {'requests':>9} {'seconds':>9} {'jobs/s':>9} {'speedup':>8}")
+    baseline = results[0][2] if results else 0
+    for concurrency, requests, elapsed in results:
+        print(f"{concurrency:>12} {requests:>9} {elapsed:>9.2f} {job_count / elapsed:>9.1f} {baseline / elapsed:>7.1f}x")
+    return results
+
+
+class SyntheticSiteHandler(BaseHTTPRequestHandler):
+    """Serves a results page with Stepstone-like job cards under /jobs and detail pages under /job/<n>."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        cards = self.server.cards_per_page
+        if self.path.startswith('/jobs'):
+            articles = "".join(
+                f'<article data-at="job-item"><h2>Python Developer {i} (m/w/d)</h2>'
+                f'<a data-at="job-item-title" href="/job/{i}">Details</a>'
+                f'<span data-at="job-item-company-name">Company {i}</span>'
+                f'<span data-at="job-item-location">Berlin</span></article>'
+                for i in range(cards)
+            )
+            body = f"<html><body><main>{articles}</main></body></html>"
+        else:
+            paragraph = "<p>" + "We build reliable Python services for our customers. " * 15 + "</p>"
+            sections = "".join(f"<div class='section'><div>{paragraph}</div></div>" for _ in range(6))
+            nav = "".join(f"<div class='nav'><a href='#'>Link {i}</a></div>" for i in range(40))
+            body = f"<html><body><div class='page'>{nav}<article><div class='content'>{sections}</div></article></div></body></html>"
+        payload = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def start_synthetic_site(cards_per_page=25):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SyntheticSiteHandler)
+    server.cards_per_page = cards_per_page
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def count_round_trips(driver, counter=None):
+    """
+    Wrap driver.execute so every WebDriver command (including WebElement calls) is counted.
+    Pass the same counter for several drivers to get a total.
+    """
+    if counter is None:
+        counter = {'count': 0}
+    counter.setdefault('lock', threading.Lock())
+    original_execute = driver.execute
+
+    def execute(*args, **kwargs):
+        with counter['lock']:
+            counter['count'] += 1
+        return original_execute(*args, **kwargs)
+
+    driver.execute = execute
+    return counter
+
+
+def legacy_read_job_cards(driver, domain):
+    """Card extraction as it was done with one find_element call per field, twice per page."""
+    job_cards = driver.find_elements(By.XPATH, '//article[@data-at="job-item"]')
+    for job in job_cards:
+        job.find_element(By.XPATH, './/h2').text
+        job.find_element(By.XPATH, './/span[@data-at="job-item-company-name"]').text.strip()
+    cards = []
+    for job in job_cards:
+        title = job.find_element(By.XPATH, './/h2').text
+        link = job.find_element(By.XPATH, './/a[@data-at="job-item-title"]').get_attribute('href')
+        if link.startswith('/'):
+            link = domain + link
+        company = job.find_element(By.XPATH, './/span[@data-at="job-item-company-name"]').text.strip()
+        location = job.find_element(By.XPATH, './/span[@data-at="job-item-location"]').text.strip()
+        cards.append({'title': title, 'company': company, 'location': location, 'link': link})
+    return cards
+
+
+def legacy_description(driver):
+    """Description extraction as it was done with .text on every div."""
+    divs = driver.find_elements(By.TAG_NAME, 'div')
+    div_texts = [d.text for d in divs if d.text and len(d.text) > 500]
+    if div_texts:
+        return sorted(div_texts, key=len, reverse=True)[0]
+    return driver.find_element(By.TAG_NAME, 'body').text
+
+
+def benchmark_round_trips(cards_per_page):
+    """Compare WebDriver round trips per results page and per detail page, before and after."""
+    server, base_url = start_synthetic_site(cards_per_page)
+    driver = initialize_driver()
+    counter = count_round_trips(driver)
+    rows = []
+    try:
+        driver.get(f"{base_url}/jobs?page=1")
+        for label, extract in (("results page (legacy find_element)", legacy_read_job_cards),
+                               ("results page (execute_script)", read_job_cards)):
+            counter['count'] = 0
+            start = time.perf_counter()
+            cards = extract(driver, base_url)
+            rows.append((label, counter['count'], time.perf_counter() - start, len(cards)))
+
+        driver.get(f"{base_url}/job/1")
+        for label, extract in (("detail page (legacy div .text)", legacy_description),
+                               ("detail page (execute_script)", lambda d: d.execute_script(DESCRIPTION_SCRIPT, BOILERPLATE_SELECTOR))):
+            counter['count'] = 0
+            start = time.perf_counter()
+            description = extract(driver)
+            rows.append((label, counter['count'], time.perf_counter() - start, len(description)))
+    finally:
+        driver.quit()
+        server.shutdown()
+
+    print(f"\nWebDriver round trips ({cards_per_page} cards per results page):")
+    print(f"{'extraction':<38} {'round trips':>12} {'seconds':>9} {'result':>8}")
+    for label, round_trips, elapsed, size in rows:
+        print(f"{label:<38} {round_trips:>12} {elapsed:>9.3f} {size:>8}")
+    return rows
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def benchmark_scrape(replay_dir, pages, pool_size, detail_mode, latency):
+    """Run the Stepstone scraper against recorded pages and report throughput, round trips and DB write latency."""
+    server = ReplayServer(replay_dir, latency=latency).start()
+    results_pages = [entry['url'] for entry in server.manifest['pages'].values() if entry['kind'] == 'results']
+    if not results_pages:
+        server.stop()
+        print(f"No recorded results pages in {replay_dir}.")
+        return None
+    search_url = server.local_url(get_page_url(results_pages[0], 1))
+
+    counter = {'count': 0}
+
+    def counted_driver(worker_id):
+        driver = initialize_driver(worker_id)
+        count_round_trips(driver, counter)
+        return driver
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bench.db")
+        initialize_database(db_path)
+        pool = BrowserPool(pool_size, counted_driver, handle_cookies)
+        pool.first_driver(search_url)  # Browser startup is not part of the measured crawl
+        counter['count'] = 0
+        fetcher = DetailFetcher(delay=0) if detail_mode == 'http' else None
+        writer = JobWriter(db_path)
+        timings = PageTimings()
+        start = time.perf_counter()
+        try:
+            jobs_df = scrape_jobs_from_stepstone(search_url, pages, db_path, detail_fetcher=fetcher,
+                                                 browser_pool=pool, timings=timings, writer=writer)
+        finally:
+            writer.close()
+            pool.close()
+            if fetcher is not None:
+                fetcher.close()
+        elapsed = time.perf_counter() - start
+    server.stop()
+
+    crawled_pages = sum(1 for record in timings.records if record['kind'] == 'results')
+    write_ms = [seconds * 1000 for seconds in writer.write_seconds]
+    print(f"\nScraper benchmark ({pool_size} browser worker(s), {detail_mode} detail pages, {latency:.2f}s server latency):")
+    print(f"  results pages:        {crawled_pages} in {elapsed:.1f}s ({crawled_pages / elapsed:.2f} pages/s)")
+    print(f"  jobs stored:          {len(jobs_df)} ({len(jobs_df) / elapsed:.2f} jobs/s)")
+    print(f"  WebDriver round trips: {counter['count']} ({counter['count'] / max(crawled_pages, 1):.1f} per results page)")
+    print(f"  DB write latency:     avg {sum(write_ms) / max(len(write_ms), 1):.2f} ms, p95 {percentile(write_ms, 0.95):.2f} ms "
+          f"over {len(write_ms)} flushes ({writer.rows_written} rows)")
+    return {
+        'pages': crawled_pages,
+        'jobs': len(jobs_df),
+        'seconds': elapsed,
+        'round_trips': counter['count'],
+        'write_ms': write_ms,
+    }
+
+
+# What each jobscraper.py command imports before it starts working. The first entry is what
+# every command imported when jobscraper.py loaded all dependencies at module level.
+STARTUP_IMPORTS = [
+    ('all at module level (old)', "import streamlit, pandas, tqdm, openai, tiktoken, selenium.webdriver, webdriver_manager.chrome, "
+                                  "gpt_filter, llm_cache, detail_fetcher, browser_pool, ingest, page_waits, replay"),
+    ('stats', "import jobscraper, database, gpt_filter"),
+    ('filter', "import jobscraper, database, gpt_filter, llm_cache, openai"),
+    ('scrape', "import jobscraper, database, browser_pool, detail_fetcher, replay, scraper"),
+    ('dashboard', "import jobscraper, dashboard"),
+]
+
+
+def measure_imports(code, repeat=3):
+    """
+    Run `python -X importtime -c code` in a fresh interpreter `repeat` times. Returns the fastest
+    run as (wall seconds, summed import seconds, [(cumulative seconds, top-level module)]).
+    """
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=repo_dir,
+                                capture_output=True, text=True)
+        wall = time.perf_counter() - start
+        if result.returncode != 0:
+            raise RuntimeError(f"Import failed: {code}\n{result.stderr.strip().splitlines()[-1]}")
+        total_us, top_level = 0, []
+        for line in result.stderr.splitlines():
+            # "import time:  self [us] | cumulative | imported package", nesting shown by indentation
+            if not line.startswith('import time:') or 'imported package' in line:
+                continue
+            self_us, cumulative_us, module = line[len('import time:'):].split('|')
+            total_us += int(self_us)
+            if not module[1:].startswith(' '):
+                top_level.append((int(cumulative_us) / 1e6, module.strip()))
+        if best is None or wall < best[0]:
+            best = (wall, total_us / 1e6, sorted(top_level, reverse=True))
+    return best
+
+
+def benchmark_startup(repeat=3):
+    """Compare the import cost of each CLI command with importing everything up front."""
+    print(f"Startup import cost per command (fastest of {repeat} runs, `python -X importtime`):")
+    print(f"  {'command':<28}{'process':>10}{'imports':>10}  heaviest top-level imports")
+    results = []
+    for label, code in STARTUP_IMPORTS:
+        wall, imports, top_level = measure_imports(code, repeat)
+        heaviest = ", ".join(f"{module} {seconds * 1000:.0f}ms" for seconds, module in top_level[:3])
+        print(f"  {label:<28}{wall * 1000:>8.0f}ms{imports * 1000:>8.0f}ms  {heaviest}")
+        results.append((label, wall, imports))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Performance benchmarks for the job scraper")
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    filter_parser = subparsers.add_parser('filter', help='GPT filter throughput against a local mock OpenAI endpoint')
+    filter_parser.add_argument('--jobs', type=int, default=400, help='Number of synthetic jobs')
+    filter_parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8], help='Concurrency levels to compare')
+    filter_parser.add_argument('--latency', type=float, default=0.2, help='Mock response latency in seconds')
+    filter_parser.add_argument('--rpm', type=int, default=None, help='Requests per minute limit')
+    filter_parser.add_argument('--tpm', type=int, default=None, help='Tokens per minute limit')
+
+    roundtrip_parser = subparsers.add_parser('roundtrips', help='WebDriver round trips per page against a local synthetic site (needs Chrome)')
+    roundtrip_parser.add_argument('--cards', type=int, default=25, help='Job cards per results page')
+
+    scrape_parser = subparsers.add_parser('scrape', help='Scraper throughput against pages recorded with --record (needs Chrome)')
+    scrape_parser.add_argument('replay_dir', help='Directory written by jobscraper.py scrape --record DIR')
+    scrape_parser.add_argument('--pages', type=int, default=30, help='Maximum number of results pages')
+    scrape_parser.add_argument('--pool-size', type=int, default=1, help='Number of browser workers')
+    scrape_parser.add_argument('--detail-mode', choices=['http', 'selenium'], default='http', help='How detail pages are loaded')
+    scrape_parser.add_argument('--latency', type=float, default=0.0, help='Artificial server latency per page in seconds')
+
+    startup_parser = subparsers.add_parser('startup', help='Import time of each jobscraper.py command')
+    startup_parser.add_argument('--repeat', type=int, default=3, help='Runs per command; the fastest is reported')
+
+    args = parser.parse_args()
+    if args.benchmark == 'startup':
+        benchmark_startup(args.repeat)
+    elif args.benchmark == 'filter':
+        benchmark_filter(args.jobs, args.concurrency, args.latency, args.rpm, args.tpm)
+    elif args.benchmark == 'roundtrips':
+        benchmark_round_trips(args.cards)
+    elif args.benchmark == 'scrape':
+        benchmark_scrape(args.replay_dir, args.pages, args.pool_size, args.detail_mode, args.latency)
+
+
+if __name__ == '__main__':
+    main()
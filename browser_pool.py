@@ -0,0 +1,104 @@
+import queue
+import threading
+
+import profiling
+
+
+class BrowserPool:
+    """
+    A pool of browser workers that crawl result pages in parallel.
+
+    Drivers are started lazily, once per worker, and kept open between crawl() calls,
+    so the browser startup and cookie handling are paid once per pool, not once per crawl.
+    """
+
+    def __init__(self, size, driver_factory, on_driver_start=None):
+        """
+        size: number of browser workers
+        driver_factory: callable(worker_id) returning a new WebDriver
+        on_driver_start: optional callable(driver, url) run once per driver on its first page (e.g. cookie consent)
+        """
+        self.size = max(1, int(size))
+        self.driver_factory = driver_factory
+        self.on_driver_start = on_driver_start
+        self.drivers = [None] * self.size
+        self.lock = threading.Lock()
+
+    def get_driver(self, worker_id, url):
+        driver = self.drivers[worker_id]
+        if driver is None:
+            with profiling.stage("scrape.browser_start"):
+                driver = self.driver_factory(worker_id)
+                if self.on_driver_start is not None:
+                    driver.get(url)
+                    self.on_driver_start(driver)
+            self.drivers[worker_id] = driver
+        return driver
+
+    def crawl(self, pages, process_page, progress=None, stop_when=None, worker_ids=None):
+        """
+        Process pages in parallel. `pages` is a list of (page_number, url) in crawl order.
+        process_page(driver, page_number, url) returns a result, or None when the page is
+        past the end of the results; later pages are then skipped.
+        stop_when: optional callable(results) checked after every page; when it returns a page
+        number, pages after that one are skipped as well (e.g. the incremental crawl stop).
+        worker_ids: the workers to crawl with (default: all). Concurrent crawls on the same
+        pool must use disjoint workers, since a driver serves one page at a time.
+        Returns a dict page_number -> result for all processed pages.
+        """
+        work = queue.Queue()
+        for item in pages:
+            work.put(item)
+        results = {}
+        state = {'stop_page': float('inf'), 'error': None}
+
+        def worker(worker_id):
+            while True:
+                try:
+                    page, url = work.get_nowait()
+                except queue.Empty:
+                    return
+                with self.lock:
+                    if page > state['stop_page'] or state['error'] is not None:
+                        continue
+                try:
+                    driver = self.get_driver(worker_id, url)
+                    result = process_page(driver, page, url)
+                except Exception as e:
+                    with self.lock:
+                        state['error'] = e
+                    return
+                with self.lock:
+                    results[page] = result
+                    if result is None:
+                        state['stop_page'] = min(state['stop_page'], page)
+                    elif stop_when is not None:
+                        stop_page = stop_when(results)
+                        if stop_page is not None:
+                            state['stop_page'] = min(state['stop_page'], stop_page)
+                if progress is not None:
+                    progress.update(1)
+
+        if worker_ids is None:
+            worker_ids = range(self.size)
+        threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in list(worker_ids)[:len(pages)]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if state['error'] is not None:
+            raise state['error']
+        return results
+
+    def first_driver(self, url, worker_id=0):
+        """Return the first worker's driver, starting it if needed."""
+        return self.get_driver(worker_id, url)
+
+    def close(self):
+        for i, driver in enumerate(self.drivers):
+            if driver is not None:
+                try:
+                    driver.quit()
+                except Exception as e:
+                    print(f"Error closing browser worker {i}: {e}")
+                self.drivers[i] = None
@@ -0,0 +1,137 @@
+import math
+import os
+
+import streamlit as st
+
+import profiling
+from database import initialize_database, count_dashboard_jobs, get_dashboard_page, mark_jobs_deleted
+
+# Category label -> (filter type, None for all jobs; wording of the "found" line)
+CATEGORIES = {
+    "All Jobs": (None, "jobs"),
+    "Home Office Jobs (Step 2)": ("step2_homeoffice", "home-office jobs"),
+    "Interest Filtered Jobs (Step 3)": ("step3_interest", "interest-filtered jobs"),
+}
+SORT_OPTIONS = {"Company": "company", "Title": "title", "Newest first": "newest", "Relevance": "relevance"}
+PAGE_SIZE = 100
+
+
+@st.cache_resource
+def init_db_once(db_path):
+    """Initialize database only once per session"""
+    initialize_database(db_path)
+    return True
+
+
+def db_version(db_path):
+    """
+    Changes whenever the database is written to. With WAL, writes land in the -wal file and
+    reach the main file only at a checkpoint, so both files are looked at.
+    """
+    version = []
+    for path in (db_path, db_path + "-wal"):
+        try:
+            stat = os.stat(path)
+            version.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            version.append(None)
+    return tuple(version)
+
+
+# Cached per DB version: reruns (checkbox clicks, paging back) do not query SQLite again until the DB changes
+@st.cache_data(max_entries=8)
+def cached_counts(db_path, version):
+    return count_dashboard_jobs([filter_type for filter_type, _ in CATEGORIES.values() if filter_type], db_path)
+
+
+@st.cache_data(max_entries=64)
+def cached_page(db_path, version, filter_type, sort, page):
+    return get_dashboard_page(filter_type, sort, PAGE_SIZE, page * PAGE_SIZE, db_path)
+
+
+def run_streamlit_dashboard(jobs_df=None, db_path="data/jobs.db"):
+    """
+    Paged job table; only the rows of the current page are loaded from the database.
+    jobs_df: optional DataFrame shown under "All Jobs" instead of the jobs in the database.
+    """
+    st.set_page_config(page_title="Job Listings", layout="wide")
+    st.title("Job Listings")
+    # Set by `jobscraper.py dashboard --profile`: profile the queries of every rerun
+    profile_report = os.environ.get("JOBSCRAPER_PROFILE")
+    profiler = profiling.enable() if profile_report else None
+
+    # Initialize database only once per session
+    init_db_once(db_path)
+    version = db_version(db_path)
+
+    counts = cached_counts(db_path, version)
+    if jobs_df is not None:
+        counts[None] = len(jobs_df)
+
+    # Category selector; filter steps without results are not offered
+    options = [label for label, (filter_type, _) in CATEGORIES.items() if filter_type is None or counts[filter_type]]
+    selected_category = st.radio("Select job category to display:", options, index=len(options)-1)
+    filter_type, wording = CATEGORIES[selected_category]
+    total = counts[filter_type]
+    st.write(f"{total} {wording} found.")
+
+    sort_column, page_column = st.columns(2)
+    sort = SORT_OPTIONS[sort_column.selectbox("Sort by:", list(SORT_OPTIONS))]
+    pages = max(1, math.ceil(total / PAGE_SIZE))
+    page = page_column.number_input(f"Page (of {pages}):", min_value=1, max_value=pages, value=1) - 1
+
+    if filter_type is None and jobs_df is not None:
+        sort_by = {'company': 'company', 'title': 'title', 'newest': 'id', 'relevance': 'relevance_score'}[sort]
+        if sort_by not in jobs_df.columns:
+            sort_by = 'company'
+        display_df = jobs_df.sort_values(by=sort_by, ascending=sort not in ('newest', 'relevance'), na_position='last')
+        display_df = display_df.iloc[page * PAGE_SIZE:(page + 1) * PAGE_SIZE]
+    else:
+        display_df = cached_page(db_path, version, filter_type, sort, page)
+    display_df = display_df.reset_index(drop=True)
+
+    # Show title, company, location, and link in the main table, and make link clickable
+    columns = ['title', 'company', 'location', 'link', 'relevance_score']
+    columns = [col for col in columns if col in display_df.columns]
+    table_df = display_df[columns].copy()
+    table_df['Select'] = False
+    selected = st.data_editor(
+        table_df,
+        use_container_width=True,
+        num_rows="dynamic",
+        disabled=columns,
+        column_config={
+            "link": st.column_config.LinkColumn("Link", display_text="Open Link"),
+            "relevance_score": st.column_config.NumberColumn("Relevance", format="%.1f"),
+        }
+    )
+
+    # Delete selected jobs
+    selected_indices = list(selected[selected['Select']].index)
+    st.write("Selected job indices:", selected_indices)
+
+    if selected_indices and st.button("Mark Selected Jobs as Deleted"):
+        # The write changes the DB version, so the rerun loads fresh counts and pages
+        mark_jobs_deleted([display_df.loc[idx, 'id'] for idx in selected_indices], db_path)
+        st.success(f"Marked {len(selected_indices)} job(s) as deleted")
+        st.rerun()
+
+    # Display selected job details
+    for idx, row in selected[selected['Select']].iterrows():
+        st.markdown(f"**{row['title']}**  ")
+        if 'company' in row:
+            st.markdown(f"*Company:* {row['company']}")
+        if 'location' in row:
+            st.markdown(f"*Location:* {row['location']}")
+        if 'search_url' in display_df.columns and display_df.loc[idx, 'search_url']:
+            st.markdown(f"*Found by search:* {display_df.loc[idx, 'search_url']}")
+        st.markdown(f"[Link to job posting]({display_df.loc[idx, 'link']})")
+        st.markdown("---")
+
+    if profiler is not None:
+        profiler.save(profile_report)
+
+
+if __name__ == '__main__':
+    # streamlit run dashboard.py
+    run_streamlit_dashboard()
@@ -0,0 +1,431 @@
+import os
+import sqlite3
+
+import profiling
+from descriptions import description_hash
+from ingest import connect_for_writing
+from near_dup import update_clusters
+from ranker import update_term_stats
+from text_keys import dedup_key
+
+# pandas is imported inside the functions that return DataFrames, so the filter and stats
+# commands (which only need plain rows) do not pay for it at startup
+
+
+def ensure_column(cursor, table, column, definition):
+    """Add a column to an existing table if it is missing (lightweight schema migration)."""
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def backfill_description_hashes(cursor):
+    """
+    Fill in the content hash of descriptions stored before the column existed. The stored text
+    is hashed as it is; it is not cleaned, so the original text of old rows is never lost.
+    """
+    rows = cursor.execute("SELECT id, description FROM jobs WHERE description_hash IS NULL").fetchall()
+    if not rows:
+        return
+    cursor.executemany("UPDATE jobs SET description_hash = ? WHERE id = ?",
+                       [(description_hash(description), job_id) for job_id, description in rows])
+    print(f"Hashed the descriptions of {len(rows)} existing jobs.")
+
+
+def backfill_dedup_keys(cursor):
+    """
+    Fill in dedup_key for jobs stored before the column existed (or whose key was reset for a new
+    normalization). If several old rows normalize to the same key, the oldest one keeps it and the
+    others get a key suffixed with "|<id>" (keys never contain a second "|"),
+    so the unique index can be created without touching the rows themselves.
+    """
+    rows = cursor.execute("SELECT id, title, company FROM jobs WHERE dedup_key IS NULL ORDER BY id").fetchall()
+    if not rows:
+        return
+    taken = set(row[0] for row in cursor.execute("SELECT dedup_key FROM jobs WHERE dedup_key IS NOT NULL"))
+    updates = []
+    for job_id, title, company in rows:
+        key = dedup_key(title, company)
+        if key in taken:
+            key = f"{key}|{job_id}"
+        taken.add(key)
+        updates.append((key, job_id))
+    cursor.executemany("UPDATE jobs SET dedup_key = ? WHERE id = ?", updates)
+    print(f"Computed dedup keys for {len(updates)} existing jobs.")
+
+
+# Stored in PRAGMA user_version. 1: dedup and title keys keep "+" and "#" (before, "C++", "C#"
+# and "C" jobs of a company got the same key and all but the first were dropped as duplicates)
+KEY_VERSION = 1
+
+
+def initialize_database(db_path="data/jobs.db"):
+    """
+    Centralized database initialization and schema management.
+    Creates the normalized schema with jobs and job_filters tables, plus the llm_cache, filter_checkpoints and crawl_watermarks tables.
+    """
+    # Ensure the data directory exists
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    
+    with sqlite3.connect(db_path) as conn:
+        cursor = conn.cursor()
+
+        # WAL is stored in the database file: the scraper's writer, the filter and the dashboard
+        # can then read while another connection writes
+        cursor.execute("PRAGMA journal_mode=WAL")
+        
+        # Create jobs table (single source of truth)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                company TEXT,
+                location TEXT,
+                description TEXT,
+                link TEXT,
+                source TEXT DEFAULT 'stepstone',
+                deleted INTEGER DEFAULT 0,
+                analyzed INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(title, company)
+            )
+        ''')
+        
+        # Create job_filters table (for filter results)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS job_filters (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id INTEGER,
+                filter_type TEXT NOT NULL,
+                value INTEGER DEFAULT 0,
+                config_hash TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (job_id) REFERENCES jobs (id),
+                UNIQUE(job_id, filter_type)
+            )
+        ''')
+
+        # Migration: fingerprint of the filter config a verdict was computed with
+        ensure_column(cursor, 'job_filters', 'config_hash', 'TEXT')
+
+        # Migration: content hash of the cleaned description, shared by reposted/duplicate ads
+        ensure_column(cursor, 'jobs', 'description_hash', 'TEXT')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_description_hash ON jobs (description_hash)")
+        backfill_description_hashes(cursor)
+
+        # Migration: normalized title+company key, the single index used for duplicate detection
+        ensure_column(cursor, 'jobs', 'dedup_key', 'TEXT')
+        rebuild_keys = cursor.execute("PRAGMA user_version").fetchone()[0] < KEY_VERSION
+        if rebuild_keys:
+            # Keys of an older normalization are computed again (NULLs do not collide in the unique index)
+            cursor.execute("UPDATE jobs SET dedup_key = NULL")
+        backfill_dedup_keys(cursor)
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_dedup_key ON jobs (dedup_key)")
+
+        # Migration: the search (stepstone_url) a job was first found in
+        ensure_column(cursor, 'jobs', 'search_url', 'TEXT')
+
+        # Migration: local BM25 relevance to user_interests, see ranker.py
+        ensure_column(cursor, 'jobs', 'relevance_score', 'REAL')
+        # Cached term statistics for the ranker, updated whenever jobs are inserted
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS term_stats (
+                term TEXT PRIMARY KEY,
+                doc_freq INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS term_stats_state (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                last_job_id INTEGER NOT NULL,
+                doc_count INTEGER NOT NULL,
+                total_length INTEGER NOT NULL
+            )
+        ''')
+        update_term_stats(cursor)
+
+        # Migration: near-duplicate clusters (reposts with tweaked titles, the same ad from several
+        # recruiters), see near_dup.py. cluster_id is the id of the cluster's first job.
+        ensure_column(cursor, 'jobs', 'title_key', 'TEXT')
+        ensure_column(cursor, 'jobs', 'simhash', 'INTEGER')
+        ensure_column(cursor, 'jobs', 'cluster_id', 'INTEGER')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_title_key ON jobs (title_key)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_cluster_id ON jobs (cluster_id)")
+        # LSH index over the SimHash fingerprints: one row per band of each fingerprint
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS simhash_bands (
+                band INTEGER NOT NULL,
+                value INTEGER NOT NULL,
+                job_id INTEGER NOT NULL,
+                FOREIGN KEY (job_id) REFERENCES jobs (id)
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_simhash_bands_band_value ON simhash_bands (band, value)")
+        if rebuild_keys:
+            # Title keys share the dedup key normalization: cluster all jobs again
+            cursor.execute("UPDATE jobs SET title_key = NULL, simhash = NULL, cluster_id = NULL")
+            cursor.execute("DELETE FROM simhash_bands")
+        clustered, joined = update_clusters(cursor)
+        if clustered:
+            print(f"Clustered {clustered} existing jobs, {joined} of them near-duplicates of another job.")
+
+        # Indexes for the dashboard queries: jobs passing a filter step, and visible jobs sorted by company
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_job_filters_type_value ON job_filters (filter_type, value, job_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_deleted_company ON jobs (deleted, company)")
+
+        # Create llm_cache table (per-job GPT verdicts keyed by prompt fingerprint)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                cache_key TEXT PRIMARY KEY,
+                step TEXT NOT NULL,
+                verdict INTEGER NOT NULL,
+                hits INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # Create filter_checkpoints table (verdicts of answered requests of a filter run that has not
+        # finished yet; dropped once the jobs are marked as analyzed)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS filter_checkpoints (
+                config_hash TEXT NOT NULL,
+                step TEXT NOT NULL,
+                job_id INTEGER NOT NULL,
+                verdict INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (config_hash, step, job_id)
+            )
+        ''')
+
+        # Create crawl_watermarks table (where the last crawl of each search stopped, for incremental crawls)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS crawl_watermarks (
+                search_url TEXT PRIMARY KEY,
+                head_key TEXT,
+                last_new_page INTEGER,
+                pages_crawled INTEGER,
+                pages_saved INTEGER,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        cursor.execute(f"PRAGMA user_version = {KEY_VERSION}")
+        conn.commit()
+        print(f"Database initialization complete. Normalized schema ready at {db_path}")
+
+
+def get_jobs_from_db(filter_type=None, db_path="data/jobs.db", include_deleted=False):
+    """
+    Centralized function to load jobs from database with optional filtering.
+    
+    Args:
+        filter_type: None for all jobs, 'step2_homeoffice', 'step3_interest', etc.
+        db_path: Path to database
+        include_deleted: Whether to include deleted jobs
+    
+    Returns:
+        DataFrame with job data
+    """
+    import pandas as pd
+
+    if not os.path.exists(db_path):
+        return pd.DataFrame(columns=['id', 'title', 'company', 'location', 'description', 'link', 'deleted', 'analyzed'])
+    
+    with sqlite3.connect(db_path) as conn:
+        try:
+            if filter_type is None:
+                # Get all jobs
+                if include_deleted:
+                    query = "SELECT * FROM jobs"
+                else:
+                    query = "SELECT * FROM jobs WHERE deleted = 0"
+            else:
+                # Get jobs with specific filter
+                if include_deleted:
+                    query = """
+                        SELECT j.* FROM jobs j
+                        JOIN job_filters jf ON j.id = jf.job_id
+                        WHERE jf.filter_type = ? AND jf.value = 1
+                    """
+                else:
+                    query = """
+                        SELECT j.* FROM jobs j
+                        JOIN job_filters jf ON j.id = jf.job_id
+                        WHERE jf.filter_type = ? AND jf.value = 1 AND j.deleted = 0
+                    """
+                return pd.read_sql(query, conn, params=[filter_type])
+            
+            return pd.read_sql(query, conn)
+        except Exception as e:
+            print(f"Error loading jobs: {e}")
+            return pd.DataFrame(columns=['id', 'title', 'company', 'location', 'description', 'link', 'deleted', 'analyzed'])
+
+
+# Columns the dashboard table shows; descriptions are never loaded for it
+DASHBOARD_COLUMNS = ['id', 'title', 'company', 'location', 'link', 'search_url', 'relevance_score']
+# Dashboard sort options -> ORDER BY clause; id makes the order stable across pages
+DASHBOARD_SORT_ORDERS = {
+    'company': "j.company, j.id",
+    'title': "j.title, j.id",
+    'newest': "j.id DESC",
+    'relevance': "j.relevance_score IS NULL, j.relevance_score DESC, j.id",
+}
+
+
+def count_dashboard_jobs(filter_types, db_path="data/jobs.db"):
+    """
+    Number of visible (not deleted) jobs, overall under the key None and per filter type in
+    filter_types (jobs that passed that step), computed in SQL.
+    """
+    with profiling.stage("dashboard.counts"), sqlite3.connect(db_path) as conn:
+        counts = {None: conn.execute("SELECT COUNT(*) FROM jobs WHERE deleted = 0").fetchone()[0]}
+        for filter_type in filter_types:
+            counts[filter_type] = conn.execute("""
+                SELECT COUNT(*) FROM job_filters jf JOIN jobs j ON j.id = jf.job_id
+                WHERE jf.filter_type = ? AND jf.value = 1 AND j.deleted = 0
+            """, (filter_type,)).fetchone()[0]
+    return counts
+
+
+def get_dashboard_page(filter_type=None, sort='company', limit=100, offset=0, db_path="data/jobs.db"):
+    """
+    One page of visible jobs for the dashboard table: only DASHBOARD_COLUMNS, sorted and paged
+    by SQLite (LIMIT/OFFSET), optionally only jobs that passed filter_type.
+    """
+    import pandas as pd
+
+    columns = ", ".join(f"j.{column}" for column in DASHBOARD_COLUMNS)
+    order_by = DASHBOARD_SORT_ORDERS[sort]
+    if filter_type is None:
+        query = f"SELECT {columns} FROM jobs j WHERE j.deleted = 0 ORDER BY {order_by} LIMIT ? OFFSET ?"
+        params = (limit, offset)
+    else:
+        query = f"""
+            SELECT {columns} FROM jobs j
+            JOIN job_filters jf ON j.id = jf.job_id
+            WHERE jf.filter_type = ? AND jf.value = 1 AND j.deleted = 0
+            ORDER BY {order_by} LIMIT ? OFFSET ?
+        """
+        params = (filter_type, limit, offset)
+    with profiling.stage("dashboard.page"), sqlite3.connect(db_path) as conn:
+        return pd.read_sql(query, conn, params=params)
+
+
+def mark_jobs_deleted(job_ids, db_path="data/jobs.db"):
+    """Soft-delete jobs by id."""
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany("UPDATE jobs SET deleted = 1 WHERE id = ?", [(int(job_id),) for job_id in job_ids])
+        conn.commit()
+
+
+def load_jobs_to_filter(config_hash, db_path="data/jobs.db"):
+    """
+    Load only the jobs that still need a filter verdict: not deleted and not yet analyzed
+    with the current filter config fingerprint (new jobs and jobs with stale verdicts).
+    Returns a list of dicts with id, title, description, description_hash, company and cluster_id,
+    ordered by id so that reruns batch the same jobs the same way.
+    """
+    query = """
+        SELECT j.id, j.title, j.description, j.description_hash, j.company, j.cluster_id FROM jobs j
+        WHERE j.deleted = 0 AND NOT EXISTS (
+            SELECT 1 FROM job_filters jf
+            WHERE jf.job_id = j.id AND jf.filter_type = 'analyzed' AND jf.config_hash = ?
+        )
+        ORDER BY j.id
+    """
+    with sqlite3.connect(db_path) as conn:
+        conn.row_factory = sqlite3.Row
+        return [dict(row) for row in conn.execute(query, (config_hash,))]
+
+
+def count_jobs(db_path="data/jobs.db"):
+    """Number of rows in the jobs table, including deleted jobs."""
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+
+def get_crawl_watermark(search_url, db_path="data/jobs.db"):
+    """Return the watermark of the last completed crawl of search_url as a dict, or None."""
+    with sqlite3.connect(db_path) as conn:
+        conn.row_factory = sqlite3.Row
+        row = conn.execute("SELECT * FROM crawl_watermarks WHERE search_url = ?", (search_url,)).fetchone()
+    return dict(row) if row else None
+
+
+def save_crawl_watermark(search_url, head_key, last_new_page, pages_crawled, pages_saved, db_path="data/jobs.db"):
+    """
+    Store where a crawl of search_url ended: the dedup key of the first job on page 1, the last
+    page that had new jobs, and how many pages were crawled and skipped by the early stop.
+    """
+    with connect_for_writing(db_path) as conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO crawl_watermarks (search_url, head_key, last_new_page, pages_crawled, pages_saved, updated_at)
+            VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        """, (search_url, head_key, last_new_page, pages_crawled, pages_saved))
+    conn.close()
+
+
+def filter_and_output_jobs(filter_results, db_path="data/jobs.db", config_hash=None):
+    """
+    Update job filter results in the job_filters table and mark the jobs as analyzed
+    
+    filter_results: dict step -> {job_id: 0/1} from the filter_jobs_by_interest function
+    config_hash: fingerprint of the filter config, stored with every verdict; the jobs' verdicts
+        from older configs are dropped, so incremental runs know these jobs are up to date
+    The verdicts, the 'analyzed' markers and the removal of the jobs' filter checkpoints are
+    written in one transaction: an interrupted or locked write leaves the checkpoints in place
+    for the next run.
+    """
+    job_ids = sorted(set(job_id for verdicts in filter_results.values() for job_id in verdicts))
+    with profiling.stage("filter.store_verdicts"), connect_for_writing(db_path) as conn:
+        cursor = conn.cursor()
+        if config_hash is not None:
+            cursor.executemany("DELETE FROM job_filters WHERE job_id = ? AND (config_hash IS NULL OR config_hash != ?)",
+                               [(job_id, config_hash) for job_id in job_ids])
+        for step, verdicts in filter_results.items():
+            cursor.executemany("""
+                INSERT OR REPLACE INTO job_filters (job_id, filter_type, value, config_hash)
+                VALUES (?, ?, ?, ?)
+            """, [(job_id, step, value, config_hash) for job_id, value in verdicts.items()])
+        cursor.executemany("""
+            INSERT OR REPLACE INTO job_filters (job_id, filter_type, value, config_hash)
+            VALUES (?, 'analyzed', 1, ?)
+        """, [(job_id, config_hash) for job_id in job_ids])
+        cursor.executemany("UPDATE jobs SET analyzed = 1 WHERE id = ?", [(job_id,) for job_id in job_ids])
+        cursor.executemany("DELETE FROM filter_checkpoints WHERE job_id = ?", [(job_id,) for job_id in job_ids])
+    conn.close()
+
+    for step, verdicts in filter_results.items():
+        print(f"{step}: {sum(verdicts.values())} of {len(verdicts)} jobs passed, verdicts stored in job_filters")
+
+
+def get_stats(config_hash, db_path="data/jobs.db"):
+    """
+    Counts for a quick health check, computed with aggregate queries only: jobs, deleted jobs,
+    jobs analyzed / still pending for config_hash, jobs that passed each filter step and the
+    number of LLM cache entries.
+    """
+    with sqlite3.connect(db_path) as conn:
+        jobs, deleted, newest_job = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(deleted), 0), MAX(created_at) FROM jobs"
+        ).fetchone()
+        analyzed = conn.execute("""
+            SELECT COUNT(*) FROM jobs j JOIN job_filters jf ON jf.job_id = j.id
+            WHERE j.deleted = 0 AND jf.filter_type = 'analyzed' AND jf.config_hash = ?
+        """, (config_hash,)).fetchone()[0]
+        passed = dict(conn.execute("""
+            SELECT jf.filter_type, COUNT(*) FROM jobs j JOIN job_filters jf ON jf.job_id = j.id
+            WHERE j.deleted = 0 AND jf.value = 1 AND jf.config_hash = ? AND jf.filter_type != 'analyzed'
+            GROUP BY jf.filter_type ORDER BY jf.filter_type
+        """, (config_hash,)).fetchall())
+        llm_cache_entries = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+    return {
+        'jobs': jobs,
+        'deleted': deleted,
+        'newest_job': newest_job,
+        'analyzed': analyzed,
+        'pending': jobs - deleted - analyzed,
+        'passed': passed,
+        'llm_cache_entries': llm_cache_entries,
+    }
@@ -0,0 +1,79 @@
+import hashlib
+import re
+
+# Page regions that are never part of the posting body: removed before the largest text block
+# is picked, in the browser (CSS selector) and in the HTTP fetcher (XPath). Class and id names
+# match by token prefix ("cookie-banner", "similar-jobs"), not by substring, so e.g.
+# <body class="consent-given"> is not taken for a consent banner.
+BOILERPLATE_PREFIXES = ('cookie', 'consent', 'similar', 'recommend')
+BOILERPLATE_SELECTOR = ", ".join(
+    ['nav', 'header', 'footer', 'aside', '[role="navigation"]', '[role="banner"]', '[role="contentinfo"]', '[data-at^="similar"]'] +
+    [f'[id^="{prefix}"], [class^="{prefix}"], [class*=" {prefix}"]' for prefix in BOILERPLATE_PREFIXES]
+)
+# <html>, <body> and regions that contain the main content are kept even if they match
+BOILERPLATE_XPATH = (
+    '(//nav | //header | //footer | //aside'
+    ' | //*[@role="navigation" or @role="banner" or @role="contentinfo" or starts-with(@data-at, "similar")]'
+    ' | //*[' + " or ".join(
+        f'starts-with(@id, "{prefix}") or contains(concat(" ", normalize-space(@class)), " {prefix}")'
+        for prefix in BOILERPLATE_PREFIXES
+    ) + '])'
+    '[not(self::html or self::body) and not(.//main or .//article or .//*[@role="main"])]'
+)
+
+# A line starting like this begins the "similar jobs"/recommendation part below the posting
+TRAILER_PATTERN = re.compile(
+    r"^(ähnliche jobs|aehnliche jobs|similar jobs|weitere jobs|mehr jobs|jobs, die dich auch interessieren|"
+    r"das könnte dich auch interessieren|das koennte dich auch interessieren|you might also like|"
+    r"more jobs|other jobs|andere nutzer haben sich auch|people also viewed)\b",
+    re.IGNORECASE
+)
+
+# Whole lines that are navigation, consent or footer text rather than posting content
+BOILERPLATE_PATTERN = re.compile(
+    r"^(jetzt bewerben|schnellbewerbung|bewerben|apply now|apply|merken|job merken|job speichern|speichern|save job|"
+    r"teilen|share|drucken|print|anmelden|einloggen|login|log in|registrieren|sign up|zurück|zurück zur suche|"
+    r"back to search|zur trefferliste|startseite|home|menü|menu|suche|search|impressum|datenschutz|"
+    r"datenschutzerklärung|agb|nutzungsbedingungen|privacy policy|terms of use|cookie-einstellungen|"
+    r"cookie settings|alle akzeptieren|alles akzeptieren|accept all|ablehnen|reject all|einstellungen|"
+    r"job melden|report job|gehalt anzeigen|alle jobs (von|bei) .*|© .*|copyright .*)$",
+    re.IGNORECASE
+)
+
+COOKIE_PATTERN = re.compile(r"\b(cookies?|tracking|consent)\b.*\b(akzeptier|accept|zustimm|agree|einwillig|settings|einstellungen)", re.IGNORECASE)
+
+
+def clean_description(text):
+    """
+    Reduce an extracted detail page text to the posting body: drop navigation, cookie and footer
+    lines, everything from the "similar jobs" block on, and repeated lines.
+    """
+    if not text:
+        return ''
+    lines = []
+    seen = set()
+    for raw_line in text.splitlines():
+        line = re.sub(r'\s+', ' ', raw_line).strip()
+        if len(line) < 3:
+            continue
+        if TRAILER_PATTERN.match(line) and lines:
+            break
+        if BOILERPLATE_PATTERN.match(line):
+            continue
+        if len(line) < 300 and COOKIE_PATTERN.search(line):
+            continue
+        # Sticky headers and apply buttons often repeat; keep the first occurrence
+        key = line.lower()
+        if key in seen and len(line) < 120:
+            continue
+        seen.add(key)
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def description_hash(text):
+    """Content hash of a cleaned description, insensitive to case and whitespace. '' for no text."""
+    normalized = re.sub(r'\s+', ' ', text or '').strip().lower()
+    if not normalized:
+        return ''
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
@@ -0,0 +1,110 @@
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import lxml.html
+import requests
+from requests.adapters import HTTPAdapter
+
+import profiling
+from descriptions import BOILERPLATE_XPATH
+from rate_limit import HostThrottle
+
+DEFAULT_HEADERS = {
+    'User-Agent': ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                   '(KHTML, like Gecko) Chrome/124.0 Safari/537.36'),
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'de-DE,de;q=0.9,en;q=0.8',
+}
+
+# Same threshold the Selenium extraction uses for "real" description blocks
+MIN_DESCRIPTION_LENGTH = 500
+
+
+def html_to_text(element):
+    """Visible text of an lxml element, one line per text node, similar to Selenium's .text."""
+    lines = (re.sub(r'\s+', ' ', text).strip() for text in element.itertext())
+    return "\n".join(line for line in lines if line)
+
+
+def extract_description(html):
+    """
+    Return the largest text block (div with more than MIN_DESCRIPTION_LENGTH characters) of a
+    job detail page, ignoring navigation, footer, cookie and "similar jobs" regions, or None if
+    the page has no such block (e.g. the content is rendered by JS).
+    """
+    try:
+        tree = lxml.html.fromstring(html)
+    except (lxml.etree.ParserError, ValueError):
+        return None
+    for element in tree.xpath('//script | //style | //noscript | //template'):
+        element.drop_tree()
+    for element in tree.xpath(BOILERPLATE_XPATH):
+        # The XPath keeps <html> and <body>; a match inside an already dropped region has no parent
+        if element.getparent() is not None:
+            element.drop_tree()
+    longest = ''
+    for div in tree.iter('div'):
+        text = html_to_text(div)
+        if len(text) > len(longest):
+            longest = text
+    if len(longest) > MIN_DESCRIPTION_LENGTH:
+        return longest
+    return None
+
+
+class DetailFetcher:
+    """
+    Fetches job detail pages over a pooled keep-alive HTTP session with bounded concurrency
+    and a per-host politeness delay. Pages that cannot be parsed without JavaScript are
+    reported as None so the caller can fall back to Selenium.
+    """
+
+    def __init__(self, workers=8, delay=0.5, timeout=15, recorder=None, throttle=None):
+        self.workers = workers
+        self.timeout = timeout
+        self.recorder = recorder
+        # A throttle shared with the browser workers keeps one request budget per host
+        self.throttle = throttle if throttle is not None else HostThrottle(delay)
+        self.session = requests.Session()
+        self.session.headers.update(DEFAULT_HEADERS)
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=1)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def adopt_browser_session(self, driver):
+        """Reuse the Selenium session's user agent and cookies (e.g. cookie consent) for HTTP requests."""
+        try:
+            self.session.headers['User-Agent'] = driver.execute_script("return navigator.userAgent;")
+            for cookie in driver.get_cookies():
+                self.session.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain'), path=cookie.get('path', '/'))
+        except Exception as e:
+            print(f"Could not copy browser session to HTTP client: {e}")
+
+    def fetch(self, url):
+        """Return the description for one detail page, or None if it needs the browser."""
+        self.throttle.wait(url)
+        start = time.perf_counter()
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+        except requests.RequestException as e:
+            print(f"HTTP error loading detail page {url}: {e}")
+            return None
+        profiling.observe("http.detail_page", time.perf_counter() - start)
+        if response.status_code != 200:
+            print(f"HTTP {response.status_code} for detail page {url}")
+            return None
+        if self.recorder is not None:
+            self.recorder.save(url, response.text, 'detail')
+        return extract_description(response.text)
+
+    def fetch_many(self, urls):
+        """Fetch several detail pages concurrently. Returns a dict of url -> description or None."""
+        unique_urls = list(dict.fromkeys(urls))
+        if not unique_urls:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(unique_urls))) as executor:
+            return dict(zip(unique_urls, executor.map(self.fetch, unique_urls)))
+
+    def close(self):
+        self.session.close()
@@ -1,123 +1,458 @@
-from openai import OpenAI
-import os
 from tqdm import tqdm
-import sys
-import pandas as pd
+import random
+import time
 import sqlite3
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import profiling
+from rate_limit import RateLimiter
+from prefilter import TitlePrefilter
 
-def filter_jobs_by_interest(openai_api_key, jobs, user_interests, jobs_to_avoid, homeoffice_required=False, jobs_to_include=None, experience_level=None, db_path="data/jobs.db"):
+MODEL = "gpt-4.1-mini"
+
+# Upper bounds on jobs per request; the token budget usually decides the batch size
+MAX_TITLE_BATCH_ITEMS = 100
+MAX_DESCRIPTION_BATCH_ITEMS = 25
+
+# Retries of transient API errors (rate limits, server errors, timeouts): exponential backoff
+# with full jitter, starting at RETRY_BASE_DELAY seconds and capped at RETRY_MAX_DELAY
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+RETRY_STATUS_CODES = (408, 409, 429, 500, 502, 503, 504)
+
+_encoding = None
+
+
+class FilterError(Exception):
+    """A filter step could not be completed, e.g. because an API error persisted after retrying."""
+
+
+def get_filter_fingerprint(user_interests, experience_level, jobs_to_avoid, homeoffice_required, relevance_min_score=None, local_prefilter=True):
+    """
+    Short hash of the filter configuration. Stored with every verdict so that jobs are only
+    re-filtered when the settings that decide their verdict have changed. This includes the
+    local decisions: the title pre-filter and the relevance cut-off before step 3.
+    """
+    payload = json.dumps({
+        'user_interests': sorted(user_interests),
+        'experience_level': (experience_level or 'any').lower(),
+        'jobs_to_avoid': sorted(jobs_to_avoid),
+        'homeoffice_required': bool(homeoffice_required),
+        # float(): 0 and 0.0 in config.json are the same setting
+        'relevance_min_score': None if relevance_min_score is None else float(relevance_min_score),
+        'local_prefilter': bool(local_prefilter),
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def get_encoding():
+    """Local tokenizer for MODEL, or None if tiktoken or its encoding files are unavailable."""
+    global _encoding
+    if _encoding is None:
+        # Imported on first use, so importing this module (e.g. for get_filter_fingerprint) stays cheap
+        try:
+            import tiktoken
+        except ImportError:
+            _encoding = False
+            return None
+        try:
+            try:
+                _encoding = tiktoken.encoding_for_model(MODEL)
+            except KeyError:
+                # Older tiktoken releases do not know MODEL; it uses the o200k_base encoding
+                _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            print(f"Tokenizer unavailable, falling back to token estimates: {e}")
+            _encoding = False
+    return _encoding or None
+
+
+def estimate_tokens(text):
+    """Token count of `text` with the local tokenizer, or about four characters per token without it."""
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def truncate_to_tokens(text, max_tokens):
+    """
+    Shorten text to about max_tokens. The head and the tail are kept (3:1), since postings
+    usually start with the role and end with benefits such as remote work.
+    """
+    if not max_tokens or estimate_tokens(text) <= max_tokens:
+        return text
+    encoding = get_encoding()
+    head_tokens = max_tokens * 3 // 4
+    tail_tokens = max_tokens - head_tokens
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        head, tail = encoding.decode(tokens[:head_tokens]), encoding.decode(tokens[-tail_tokens:])
+    else:
+        head, tail = text[:head_tokens * 4], text[-tail_tokens * 4:]
+    return f"{head} [...] {tail}"
+
+
+def plan_batches(items, item_tokens, token_budget, max_items):
+    """
+    Greedily pack items, in order, into batches of at most max_items whose summed
+    item_tokens stay within token_budget. An item larger than the budget gets its own batch.
+    """
+    batches = []
+    current, current_tokens = [], 0
+    for item, tokens in zip(items, item_tokens):
+        if current and (current_tokens + tokens > token_budget or len(current) >= max_items):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(item)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def parse_selected_indices(content, batch_len):
+    """Turn GPT's comma separated job numbers into zero-based indices into the batch."""
+    filtered_numbers = [n.strip() for n in content.strip().split(',') if n.strip().isdigit()]
+    return [int(n)-1 for n in filtered_numbers if 0 < int(n) <= batch_len]
+
+
+def is_transient_error(error):
+    """True for API errors worth retrying: connection problems, timeouts, rate limits and server errors."""
+    import openai
+
+    if isinstance(error, openai.APIConnectionError):  # Includes timeouts
+        return True
+    if isinstance(error, openai.APIStatusError) and error.status_code in RETRY_STATUS_CODES:
+        # A 429 for an exhausted quota does not go away by waiting
+        return getattr(error, 'code', None) != 'insufficient_quota'
+    return False
+
+
+def retry_delay(attempt, error=None):
+    """Seconds to wait before retry number `attempt` (0-based); at least the server's Retry-After."""
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+    response = getattr(error, 'response', None)
+    retry_after = response.headers.get('retry-after') if response is not None else None
+    try:
+        return max(delay, min(float(retry_after), RETRY_MAX_DELAY)) if retry_after else delay
+    except ValueError:
+        return delay
+
+
+def run_batches(client, requests, desc, concurrency=1, rate_limiter=None, model=MODEL, step=None, max_retries=5, on_response=None):
+    """
+    Send chat requests and return the response texts in the same order as `requests`.
+
+    requests: list of (system_prompt, prompt_message) tuples, one per batch
+    concurrency: number of requests in flight at once (1 = sequential)
+    rate_limiter: optional RateLimiter enforcing requests/min and tokens/min
+    step: filter step the latencies and token counts are profiled under (default: desc)
+    max_retries: transient errors (see is_transient_error) are retried this often with jittered
+        exponential backoff before the error is raised
+    on_response: optional callable(batch_idx, content) called in the calling thread as soon as a
+        response arrives, e.g. to checkpoint it before later requests fail
+    """
+    step = step or desc
+
+    def send(request):
+        system_prompt, prompt_message = request
+        for attempt in range(max_retries + 1):
+            if rate_limiter:
+                rate_limiter.acquire(estimate_tokens(system_prompt) + estimate_tokens(prompt_message))
+            start = time.perf_counter()
+            try:
+                response = client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": prompt_message}
+                    ]
+                )
+                break
+            except Exception as e:
+                if attempt >= max_retries or not is_transient_error(e):
+                    raise
+                delay = retry_delay(attempt, e)
+                print(f"Transient API error ({e.__class__.__name__}), retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+                profiling.observe(f"openai.{step}.retry_wait", delay)
+                time.sleep(delay)
+        profiling.observe(f"openai.{step}", time.perf_counter() - start)
+        profiling.add_usage(step, getattr(response, 'usage', None))
+        return response.choices[0].message.content
+
+    results = [None] * len(requests)
+    if concurrency <= 1:
+        for batch_idx, request in enumerate(tqdm(requests, desc=desc)):
+            results[batch_idx] = send(request)
+            if on_response is not None:
+                on_response(batch_idx, results[batch_idx])
+        return results
+
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        futures = {executor.submit(send, request): batch_idx for batch_idx, request in enumerate(requests)}
+        for future in tqdm(as_completed(futures), total=len(futures), desc=desc):
+            # Completion order is arbitrary, so store by batch index to keep the merge deterministic
+            results[futures[future]] = future.result()
+            if on_response is not None:
+                on_response(futures[future], results[futures[future]])
+    except BaseException:
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+    return results
+
+
+def filter_jobs_by_interest(openai_api_key, jobs, user_interests, jobs_to_avoid, homeoffice_required=False, jobs_to_include=None, experience_level=None, db_path="data/jobs.db",
+                            concurrency=1, requests_per_minute=None, tokens_per_minute=None, base_url=None, cache=None, local_prefilter=True,
+                            token_budget=8000, max_description_tokens=1500, relevance_min_score=None, batch_runner=None, max_retries=5):
     """
-    jobs: list of dicts, each with 'title' and 'description' and optionally 'analyzed' and 'id'
+    jobs: list of dicts, each with 'id', 'title' and 'description' and optionally 'analyzed', 'description_hash' and 'cluster_id'
     homeoffice_required: if True, only keep jobs that are very likely 100% home office/remote
     jobs_to_include: list of terms that should be preferred in job filtering
     experience_level: string, e.g. 'junior', 'mid', 'senior', 'any'
-    db_path: path to database for marking jobs as analyzed
+    db_path: path to database for the filter checkpoints, stored verdicts and relevance scores
+    concurrency: number of batch requests sent to the API at the same time (1 = sequential)
+    requests_per_minute / tokens_per_minute: optional client-side rate limits for the API calls
+    base_url: optional OpenAI-compatible endpoint (e.g. a local mock server)
+    cache: optional LLMCache; jobs with a cached verdict are not sent to the API again
+    local_prefilter: if True, titles that clearly contain avoid terms are rejected and titles with
+        only include terms are accepted locally; only the remaining titles go to GPT in step 1
+    token_budget: maximum prompt tokens per request; jobs are packed into batches up to this budget
+    max_description_tokens: longer descriptions are truncated (head and tail kept) before prompting
+    relevance_min_score: if not None, jobs are scored locally against user_interests (BM25, stored
+        in jobs.relevance_score) and jobs scoring at or below it are rejected in step 3 without GPT
+    batch_runner: optional BatchRunner; the requests of each step are then sent as one Batch API
+        job instead of interactive chat calls (concurrency and the rate limits do not apply)
+    max_retries: retries of a request after a transient API error (rate limit, server error, timeout)
+
+    The verdict of every answered request is checkpointed in filter_checkpoints right away. If the
+    run fails (FilterError) or is interrupted, the next run with the same filter config takes the
+    checkpointed verdicts and only sends the requests that had not been answered.
     
-    Returns a tuple with three lists:
-    1. step1_filtered_titles - after basic filtering
-    2. step2_filtered_titles - after homeoffice filtering (if required)
-    3. step3_filtered_titles - after user interests filtering
-    Also, all jobs that are processed (not skipped) will have 'analyzed' set to 1.
+    Returns a dict step -> {job_id: verdict} for 'step1_basic', 'step2_homeoffice' and
+    'step3_interest', covering every processed job. A verdict is 1 if the job passed this step
+    and all steps before it, else 0. Without homeoffice_required, step 2 repeats step 1.
+    Also, all jobs that are processed (not skipped) will have 'analyzed' set to 1 in the job dicts;
+    database.filter_and_output_jobs stores the verdicts and marks the jobs as analyzed in the database.
     """
     if jobs_to_include is None:
         jobs_to_include = []
 
     # Skip jobs that have already been analyzed
     jobs = [job for job in jobs if not job.get('analyzed', 0)]
+    # Jobs dropped by the manual filter below still count as processed
+    processed_jobs = jobs
+    config_hash = get_filter_fingerprint(user_interests, experience_level, jobs_to_avoid, homeoffice_required,
+                                         relevance_min_score, local_prefilter)
 
     # Manual filter: if experience_level is 'junior', drop all jobs with 'senior ' in the title
-    if experience_level and experience_level.lower() == 'junior':
+    # (the local pre-filter below covers this and all other avoid terms)
+    if not local_prefilter and experience_level and experience_level.lower() == 'junior':
         before_count = len(jobs)
         jobs = [job for job in jobs if 'senior ' not in job['title'].lower()]
         after_count = len(jobs)
         print(f"Manual filter: removed {before_count - after_count} jobs containing 'senior ' in the title for junior level.")
         
-    client = OpenAI(api_key=openai_api_key)
+    from openai import OpenAI
+
+    # Retries are done by run_batches, with jitter and a log line per retry
+    client = OpenAI(api_key=openai_api_key, base_url=base_url, max_retries=0)
+    rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
 
     print("Total jobs:", len(jobs))
-    batch_size = 40  
-    batches = [jobs[i:i + batch_size] for i in range(0, len(jobs), batch_size)]
-    print(f"Splitting the total jobs into {len(batches)} API requests.")
+    relevance_scores = None
+    if relevance_min_score is not None and user_interests:
+        from ranker import RelevanceRanker, describe_scores
+        with profiling.stage("filter.relevance_ranking"):
+            relevance_scores = RelevanceRanker(user_interests, db_path).score_and_store(jobs)
+        print(f"Relevance scores: {describe_scores(relevance_scores)}")
+    if concurrency > 1:
+        print(f"Sending up to {concurrency} API requests concurrently.")
 
-    step1_filtered_titles = []
-    step2_filtered_titles = []
-    step3_filtered_titles = []
+    batching_report = []
+    prompt_descriptions = {}
 
-    def get_numbered_job_entries(jobs):
-        return [f"[{i+1}] Title: {job['title']}" for i, job in enumerate(jobs)]
+    def title_entry(job):
+        return f"Title: {job['title']}"
 
-    def get_numbered_job_entries_with_desc(jobs):
-        return [f"[{i+1}] Title: {job['title']} || Description: {job['description']}" for i, job in enumerate(jobs)]
+    def title_and_description_entry(job):
+        # Truncate each description once, however many steps it goes through
+        if id(job) not in prompt_descriptions:
+            prompt_descriptions[id(job)] = truncate_to_tokens(job['description'] or '', max_description_tokens)
+        return f"Title: {job['title']} || Description: {prompt_descriptions[id(job)]}"
 
-    # Track if prompt has been dumped
-    prompt1_dumped = False
-    prompt2_dumped = False
-    prompt3_dumped = False
+    def classify(step, step_jobs, max_items, system_prompt, build_prompt, render_entry, job_inputs, desc, prompt_file, error_label,
+                 share_key=None, stored_verdicts=None):
+        """
+        Run one filter step and return the jobs GPT selected, in input order.
+        build_prompt(job_entries) builds the user prompt from numbered entries rendered by render_entry(job).
+        job_inputs(job) returns everything besides the prompts that decides this job's verdict (cache key).
+        Jobs with the same non-empty share_key(job) are sent once and share that job's verdict.
+        stored_verdicts: optional {share key: verdict} already stored for other jobs; jobs with such a
+        share key take that verdict without an API call.
+        """
+        verdicts = {}
+        keys = []
+        new_verdicts = {}
+        index_of = {int(job['id']): i for i, job in enumerate(step_jobs)}
+
+        def store_answer(job_ids, content):
+            # job_ids: the jobs of one request, in prompt order
+            filtered_indices = set(parse_selected_indices(content, len(job_ids)))
+            if step == 'step1_basic':
+                print(f"GPT returned {len(filtered_indices)} jobs for this batch")
+            answer = {job_id: 1 if position in filtered_indices else 0 for position, job_id in enumerate(job_ids)}
+            save_checkpoint(step, answer, config_hash, db_path)
+            for job_id, verdict in answer.items():
+                # Answers of a batch from an interrupted run may cover jobs that are not filtered anymore
+                if job_id in index_of:
+                    verdicts[index_of[job_id]] = verdict
+                    if cache is not None:
+                        new_verdicts[keys[index_of[job_id]]] = verdict
+
+        if cache is not None:
+            keys = [cache.make_key(MODEL, system_prompt, job_inputs(job)) for job in step_jobs]
+            cached = cache.get_many(step, keys)
+            for i, key in enumerate(keys):
+                if key in cached:
+                    verdicts[i] = cached[key]
+            if cached:
+                print(f"{len(verdicts)} of {len(step_jobs)} jobs answered from the LLM cache.")
+        if batch_runner is not None:
+            try:
+                batch_runner.resume(step, config_hash, store_answer)
+            except Exception as e:
+                raise FilterError(f"An error occurred while collecting the {step} batch of an interrupted run: {e}") from e
+        checkpointed = load_checkpoints(step, [int(step_jobs[i]['id']) for i in range(len(step_jobs)) if i not in verdicts], config_hash, db_path)
+        if checkpointed:
+            for i, job in enumerate(step_jobs):
+                if i not in verdicts and int(job['id']) in checkpointed:
+                    verdicts[i] = checkpointed[int(job['id'])]
+            print(f"{len(checkpointed)} jobs resumed from the checkpoint of an interrupted run.")
+
+        # Batch only the jobs without a cached verdict, so re-batching still hits the cache
+        pending = [i for i in range(len(step_jobs)) if i not in verdicts]
+        if stored_verdicts:
+            reused = 0
+            for i in pending:
+                key = share_key(step_jobs[i])
+                if key in stored_verdicts:
+                    verdicts[i] = stored_verdicts[key]
+                    reused += 1
+            if reused:
+                pending = [i for i in pending if i not in verdicts]
+                print(f"{reused} jobs are near-duplicates of an already filtered job and reuse its verdict.")
+        duplicates = {}  # index -> index of the job whose verdict it reuses
+        if share_key is not None:
+            # Jobs decided above (cache, checkpoint) answer for their duplicates as well
+            representatives = {}
+            for i in verdicts:
+                key = share_key(step_jobs[i])
+                if key:
+                    representatives.setdefault(key, i)
+            for i in pending:
+                key = share_key(step_jobs[i])
+                if not key:
+                    continue
+                if key in representatives:
+                    duplicates[i] = representatives[key]
+                else:
+                    representatives[key] = i
+            if duplicates:
+                pending = [i for i in pending if i not in duplicates]
+                print(f"{len(duplicates)} jobs have the same description or are near-duplicates of another job and reuse its verdict.")
+        entries = {i: render_entry(step_jobs[i]) for i in pending}
+        # Numbering adds a few tokens per entry; the prompt text around the entries is fixed
+        entry_tokens = [estimate_tokens(entries[i]) + 4 for i in pending]
+        overhead = estimate_tokens(system_prompt) + estimate_tokens(build_prompt([]))
+        batches = plan_batches(pending, entry_tokens, max(token_budget - overhead, 1), max_items)
+        print(f"Splitting {len(pending)} jobs into {len(batches)} API requests.")
+        requests = [
+            (system_prompt, build_prompt([f"[{n+1}] {entries[i]}" for n, i in enumerate(batch)]))
+            for batch in batches
+        ]
+        request_tokens = [estimate_tokens(system_prompt) + estimate_tokens(prompt) for _, prompt in requests]
+        batching_report.append((step, len(pending), request_tokens))
+        if requests:
+            # Dump first prompt message of the step for debugging
+            with open(prompt_file, 'w', encoding='utf-8') as f:
+                f.write(requests[0][1])
+        batch_job_ids = [[int(step_jobs[i]['id']) for i in batch] for batch in batches]
+        try:
+            with profiling.stage(f"filter.{step}"):
+                if batch_runner is not None:
+                    batch_runner.run(step, config_hash, requests, batch_job_ids, store_answer)
+                else:
+                    run_batches(client, requests, desc, concurrency, rate_limiter, step=step, max_retries=max_retries,
+                                on_response=lambda batch_idx, content: store_answer(batch_job_ids[batch_idx], content))
+        except Exception as e:
+            answered = sum(1 for i in pending if i in verdicts)
+            raise FilterError(f"An error occurred while processing {error_label}: {e} "
+                              f"({answered} of {len(pending)} {step} jobs answered and checkpointed)") from e
+
+        for i, representative in duplicates.items():
+            verdicts[i] = verdicts[representative]
+            if cache is not None:
+                new_verdicts[keys[i]] = verdicts[i]
+        if cache is not None:
+            cache.put_many(step, new_verdicts)
+
+        selected = []
+        for i, job in enumerate(step_jobs):
+            if verdicts.get(i):
+                job['analyzed'] = 1  # Tag as analyzed
+                selected.append(job)
+        return selected
 
     # Step 1: Filter by title only, removing jobs to avoid
     print("Step 1: Filtering by job titles (removing jobs to avoid)...")
-    title_batches = [jobs[i:i + batch_size] for i in range(0, len(jobs), batch_size)]
-    filtered_jobs_step1 = []
-    for batch_idx, batch in enumerate(tqdm(title_batches, desc="Title Filtering Progress")):
-        job_entries = get_numbered_job_entries(batch)
-        jobs_to_avoid_str = " , ".join(jobs_to_avoid)
-        include_terms_str = " , ".join(jobs_to_include) if jobs_to_include else ""
-        
-        include_instruction = ""
-        if jobs_to_include:
-            include_instruction = f" Give preference to jobs with these terms: {include_terms_str},"
-        
+    jobs_to_avoid_str = " , ".join(jobs_to_avoid)
+
+    def build_step1_prompt(job_entries):
         # Step 1: Basic filtering prompt
-        prompt_message = (
+        return (
             f"Your task is to identify job titles that do NOT contain terms such as {jobs_to_avoid_str}. "
             "Review the following job titles, each with a unique number in brackets. "
             f"Each entry is formatted as [number] Title: ...: {' '.join(job_entries)}. "
             "Return only the numbers of the job titles, separated by commas. Do not return anything else."
         )
-        # Dump first prompt message of step 1
-        if not prompt1_dumped:
-            with open('prompt_step1.txt', 'w', encoding='utf-8') as f:
-                f.write(prompt_message)
-            prompt1_dumped = True
-        try:
-            response = client.chat.completions.create(
-                model="gpt-4.1-mini",
-                messages=[
-                    {"role": "system",
-                     "content": (
-                        "You are a helpful assistant. Your task is to remove job titles that fall into the avoidance categories. "
-                        "Each job title is presented as a numbered entry in the format [number] Title: ... "
-                        "Return only the numbers of the job titles, separated by commas. Do not return anything else."
-                    )},
-                    {"role": "user", "content": prompt_message}
-                ]
-            )
-            filtered_numbers = [n.strip() for n in response.choices[0].message.content.strip().split(',') if n.strip().isdigit()]
-            filtered_indices = [int(n)-1 for n in filtered_numbers if n.isdigit() and 0 < int(n) <= len(batch)]
-            print(f"GPT returned {len(filtered_indices)} jobs for this batch")
-            # Map back to jobs with these indices
-            for idx in filtered_indices:
-                job = batch[idx]
-                job['analyzed'] = 1  # Tag as analyzed
-                filtered_jobs_step1.append(job)
-        except Exception as e:
-            print(f"An error occurred while processing a title batch: {e}")
-            sys.exit()
 
-    step1_filtered_titles = [job['title'].strip().rstrip('.') for job in filtered_jobs_step1 if job['title'].strip()]
-    print(f"Step 1 results: {len(step1_filtered_titles)} jobs passed the title filtering.")
+    locally_accepted = []
+    step1_candidates = jobs
+    if local_prefilter:
+        locally_accepted, locally_rejected, step1_candidates = TitlePrefilter(jobs_to_avoid, jobs_to_include).split(jobs)
+        print(f"Local pre-filter: {len(locally_rejected)} titles rejected, {len(locally_accepted)} accepted, "
+              f"{len(step1_candidates)} ambiguous titles sent to GPT.")
+
+    gpt_selected_step1 = classify(
+        'step1_basic', step1_candidates, MAX_TITLE_BATCH_ITEMS,
+        (
+            "You are a helpful assistant. Your task is to remove job titles that fall into the avoidance categories. "
+            "Each job title is presented as a numbered entry in the format [number] Title: ... "
+            "Return only the numbers of the job titles, separated by commas. Do not return anything else."
+        ),
+        build_step1_prompt, title_entry,
+        lambda job: [job['title'], jobs_to_avoid],
+        "Title Filtering Progress", 'prompt_step1.txt', "a title batch"
+    )
+    for job in locally_accepted:
+        job['analyzed'] = 1  # Tag as analyzed
+    # Keep the original job order across local and GPT decisions
+    passed_step1 = set(id(job) for job in locally_accepted + gpt_selected_step1)
+    filtered_jobs_step1 = [job for job in jobs if id(job) in passed_step1]
+
+    print(f"Step 1 results: {len(filtered_jobs_step1)} jobs passed the title filtering.")
     
     # If homeoffice is required, proceed with step 2, otherwise skip to step 3
     if homeoffice_required:
         # Step 2: Filter by description for home office requirement, with reduced batch size
         print("Step 2: Filtering by description for 100% home office...")
-        desc_batch_size = 10  # Smaller batch size for more accurate filtering
-        desc_batches = [filtered_jobs_step1[i:i + desc_batch_size] for i in range(0, len(filtered_jobs_step1), desc_batch_size)]
-        filtered_jobs_step2 = []
-        for batch_idx, batch in enumerate(tqdm(desc_batches, desc="Home Office Filtering Progress")):
-            job_entries = get_numbered_job_entries_with_desc(batch)
+        def build_step2_prompt(job_entries):
             # Step 2: Home office filtering prompt
-            prompt_message = (
+            return (
                 "Your task is to identify job listings that are VERY LIKELY to be 100% remote/home office positions. "
                 "Be extremely strict: Only select jobs where it is clearly stated that the position is fully remote, 100% home office, or similar. "
                 "Exclude jobs where remote or home office is not mentioned, or where only vague or partial options are given (such as 'homeoffice möglichkeit', 'option for home office', '1 day a week home office', or similar phrases). "
@@ -126,60 +461,40 @@ def filter_jobs_by_interest(openai_api_key, jobs, user_interests, jobs_to_avoid,
                 f"Each entry is formatted as [number] Title: ... || Description: ...: {' '.join(job_entries)}. "
                 "Return only the numbers of the job titles, separated by commas. Do not return anything else."
             )
-            # Dump first prompt message of step 2
-            if not prompt2_dumped:
-                with open('prompt_step2.txt', 'w', encoding='utf-8') as f:
-                    f.write(prompt_message)
-                prompt2_dumped = True
-            try:
-                response = client.chat.completions.create(
-                    model="gpt-4.1-mini",
-                    messages=[
-                        {"role": "system",
-                         "content": (
-                            "You are a helpful assistant. Your task is to identify job titles that are VERY LIKELY 100% home office/remote. "
-                            "Be extremely strict: Only select jobs where it is clearly stated that the position is fully remote, 100% home office, or similar. "
-                            "Exclude jobs where remote or home office is not mentioned, or where only vague or partial options are given (such as 'homeoffice möglichkeit', 'option for home office', '1 day a week home office', or similar phrases). "
-                            "Be strict in your evaluation of remote work indicators. "
-                            "Each job listing is presented as a numbered entry in the format [number] Title: ... || Description: ... "
-                            "Return only the numbers of the job titles, separated by commas. Do not return anything else."
-                        )},
-                        {"role": "user", "content": prompt_message}
-                    ]
-                )
-                filtered_numbers = [n.strip() for n in response.choices[0].message.content.strip().split(',') if n.strip().isdigit()]
-                filtered_indices = [int(n)-1 for n in filtered_numbers if n.isdigit() and 0 < int(n) <= len(batch)]
-                for idx in filtered_indices:
-                    job = batch[idx]
-                    job['analyzed'] = 1  # Tag as analyzed
-                    filtered_jobs_step2.append(job)
-            except Exception as e:
-                print(f"An error occurred while processing a description batch: {e}")
-                sys.exit()
+
+        filtered_jobs_step2 = classify(
+            'step2_homeoffice', filtered_jobs_step1, MAX_DESCRIPTION_BATCH_ITEMS,
+            (
+                "You are a helpful assistant. Your task is to identify job titles that are VERY LIKELY 100% home office/remote. "
+                "Be extremely strict: Only select jobs where it is clearly stated that the position is fully remote, 100% home office, or similar. "
+                "Exclude jobs where remote or home office is not mentioned, or where only vague or partial options are given (such as 'homeoffice möglichkeit', 'option for home office', '1 day a week home office', or similar phrases). "
+                "Be strict in your evaluation of remote work indicators. "
+                "Each job listing is presented as a numbered entry in the format [number] Title: ... || Description: ... "
+                "Return only the numbers of the job titles, separated by commas. Do not return anything else."
+            ),
+            build_step2_prompt, title_and_description_entry,
+            lambda job: [job['title'], job['description']],
+            "Home Office Filtering Progress", 'prompt_step2.txt', "a description batch",
+            share_key=lambda job: job.get('description_hash')
+        )
         
-        step2_filtered_titles = [job['title'].strip().rstrip('.') for job in filtered_jobs_step2 if job['title'].strip()]
-        print(f"Step 2 results: {len(step2_filtered_titles)} jobs passed the home office filtering.")
+        print(f"Step 2 results: {len(filtered_jobs_step2)} jobs passed the home office filtering.")
         
         # Prepare jobs for step 3
         jobs_to_filter_step3 = filtered_jobs_step2
     else:
         # Skip step 2, use step 1 results for step 3
-        step2_filtered_titles = step1_filtered_titles
         jobs_to_filter_step3 = filtered_jobs_step1
         print("Skipping Step 2 (home office filtering) as it's not required.")
     
     # Step 3: Filter by user interests
     print("Step 3: Filtering by user interests...")
-    interest_batch_size = 10  # Smaller batch size for more detailed filtering
-    interest_batches = [jobs_to_filter_step3[i:i + interest_batch_size] for i in range(0, len(jobs_to_filter_step3), interest_batch_size)]
-    filtered_jobs_step3 = []
-    for batch_idx, batch in enumerate(tqdm(interest_batches, desc="Interest Filtering Progress")):
-        job_entries = get_numbered_job_entries_with_desc(batch)
-        interests_str = ", ".join(user_interests)
-        custom_exclude_terms_str = " , ".join(jobs_to_avoid)
-        
+    interests_str = ", ".join(user_interests)
+    custom_exclude_terms_str = " , ".join(jobs_to_avoid)
+
+    def build_step3_prompt(job_entries):
         # Step 3: Interest and exclusion filtering prompt
-        prompt_message = (
+        return (
             f"Your task is to identify job listings that align with the user's interests ({interests_str}) "
             f"and do NOT match any of the following avoidance instructions or requirements: {custom_exclude_terms_str}. "
             "This includes jobs whose title or description suggests any of these requirements, even if the exact wording is not used. "
@@ -187,53 +502,87 @@ def filter_jobs_by_interest(openai_api_key, jobs, user_interests, jobs_to_avoid,
             f"Each entry is formatted as [number] Title: ... || Description: ...: {' '.join(job_entries)}. "
             "Return only the numbers of the job titles, separated by commas. Do not return anything else."
         )
-        # Dump first prompt message of step 3
-        if not prompt3_dumped:
-            with open('prompt_step3.txt', 'w', encoding='utf-8') as f:
-                f.write(prompt_message)
-            prompt3_dumped = True
-        try:
-            response = client.chat.completions.create(
-                model="gpt-4.1-mini",
-                messages=[
-                    {"role": "system",
-                     "content": (
-                        "You are a helpful assistant. Your task is to identify job titles that align with the user's specified interests "
-                        "and do not match any of the user's avoidance instructions or requirements (not just keywords, but also described requirements or conditions). "
-                        "Each job listing is presented as a numbered entry in the format [number] Title: ... || Description: ... "
-                        "Return only the numbers of the job titles, separated by commas. Do not return anything else."
-                    )},
-                    {"role": "user", "content": prompt_message}
-                ]
-            )
-            filtered_numbers = [n.strip() for n in response.choices[0].message.content.strip().split(',') if n.strip().isdigit()]
-            filtered_indices = [int(n)-1 for n in filtered_numbers if n.isdigit() and 0 < int(n) <= len(batch)]
-            for idx in filtered_indices:
-                job = batch[idx]
-                job['analyzed'] = 1  # Tag as analyzed
-                filtered_jobs_step3.append(job)
-        except Exception as e:
-            print(f"An error occurred while processing an interest batch: {e}")
-            sys.exit()
-    
-    step3_filtered_titles = [job['title'].strip().rstrip('.') for job in filtered_jobs_step3 if job['title'].strip()]
-    print(f"Step 3 results: {len(step3_filtered_titles)} jobs passed the interest filtering.")
+
+    step3_candidates = jobs_to_filter_step3
+    if relevance_scores is not None:
+        from ranker import split_by_relevance
+        step3_candidates, relevance_rejected = split_by_relevance(jobs_to_filter_step3, relevance_scores, relevance_min_score)
+        print(f"Relevance ranking: {len(relevance_rejected)} jobs score at most {relevance_min_score} and are rejected locally, "
+              f"{len(step3_candidates)} sent to GPT.")
+
+    # Near-duplicates (same cluster, see near_dup.py) are judged once; a cluster that already has a
+    # stored interest verdict for this filter config is not sent again
+    def cluster_key(job):
+        return f"cluster:{job['cluster_id']}" if job.get('cluster_id') is not None else job.get('description_hash')
+
+    from near_dup import load_cluster_verdicts
+    cluster_ids = [job['cluster_id'] for job in step3_candidates if job.get('cluster_id') is not None]
+    stored_step3 = load_cluster_verdicts(cluster_ids, config_hash, db_path).get('step3_interest', {}) if cluster_ids else {}
+
+    filtered_jobs_step3 = classify(
+        'step3_interest', step3_candidates, MAX_DESCRIPTION_BATCH_ITEMS,
+        (
+            "You are a helpful assistant. Your task is to identify job titles that align with the user's specified interests "
+            "and do not match any of the user's avoidance instructions or requirements (not just keywords, but also described requirements or conditions). "
+            "Each job listing is presented as a numbered entry in the format [number] Title: ... || Description: ... "
+            "Return only the numbers of the job titles, separated by commas. Do not return anything else."
+        ),
+        build_step3_prompt, title_and_description_entry,
+        lambda job: [job['title'], job['description'], user_interests, jobs_to_avoid],
+        "Interest Filtering Progress", 'prompt_step3.txt', "an interest batch",
+        share_key=cluster_key, stored_verdicts={f"cluster:{cluster_id}": verdict for cluster_id, verdict in stored_step3.items()}
+    )
     
-    # Mark all processed jobs as analyzed in the database
-    mark_jobs_as_analyzed(jobs, db_path)
+    print(f"Step 3 results: {len(filtered_jobs_step3)} jobs passed the interest filtering.")
+
+    print_batching_report(batching_report, token_budget)
+
+    if cache is not None:
+        cache.report()
+        cache.evict()
     
-    return (step1_filtered_titles, step2_filtered_titles, step3_filtered_titles)
+    processed_ids = [int(job['id']) for job in processed_jobs]
+
+    verdicts = {}
+    for step, passed_jobs in (('step1_basic', filtered_jobs_step1),
+                              ('step2_homeoffice', jobs_to_filter_step3),
+                              ('step3_interest', filtered_jobs_step3)):
+        passed_ids = set(int(job['id']) for job in passed_jobs)
+        verdicts[step] = {job_id: int(job_id in passed_ids) for job_id in processed_ids}
+    return verdicts
+
+def print_batching_report(batching_report, token_budget):
+    """Print calls and prompt tokens per call for each step of a filter run."""
+    print(f"Batching report (token budget {token_budget} per request):")
+    total_calls = 0
+    for step, job_count, request_tokens in batching_report:
+        total_calls += len(request_tokens)
+        if not request_tokens:
+            print(f"  {step}: no API calls")
+            continue
+        average = sum(request_tokens) / len(request_tokens)
+        print(f"  {step}: {job_count} jobs in {len(request_tokens)} calls, "
+              f"{average:.0f} tokens/call on average (min {min(request_tokens)}, max {max(request_tokens)})")
+    print(f"  Total API calls this run: {total_calls}")
 
-def mark_jobs_as_analyzed(jobs, db_path):
-    """Mark jobs as analyzed in the database"""
+def load_checkpoints(step, job_ids, config_hash, db_path):
+    """Checkpointed verdicts {job id: verdict} of a step for the given jobs and filter config."""
+    found = {}
     with sqlite3.connect(db_path) as conn:
-        cursor = conn.cursor()
-        for job in jobs:
-            if 'id' in job:
-                # Use job ID if available
-                cursor.execute("UPDATE jobs SET analyzed = 1 WHERE id = ?", (int(job['id']),))
-            else:
-                # Fallback to title+company identification
-                cursor.execute("UPDATE jobs SET analyzed = 1 WHERE title = ? AND company = ?", 
-                             (job['title'], job.get('company', '')))
-        conn.commit()
\ No newline at end of file
+        for start in range(0, len(job_ids), 500):
+            chunk = job_ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            found.update(conn.execute(
+                f"SELECT job_id, verdict FROM filter_checkpoints WHERE step = ? AND config_hash = ? AND job_id IN ({placeholders})",
+                [step, config_hash] + chunk
+            ))
+    return found
+
+
+def save_checkpoint(step, verdicts, config_hash, db_path):
+    """Commit the verdicts {job id: verdict} of one answered request, so a failed run can resume after it."""
+    with sqlite3.connect(db_path, timeout=10.0) as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO filter_checkpoints (config_hash, step, job_id, verdict) VALUES (?, ?, ?, ?)",
+            [(config_hash, step, job_id, verdict) for job_id, verdict in verdicts.items()]
+        )
@@ -0,0 +1,154 @@
+import queue
+import sqlite3
+import threading
+import time
+
+import profiling
+from near_dup import title_key, update_clusters
+from ranker import update_term_stats
+from text_keys import dedup_key
+
+INSERT_JOB_SQL = (
+    "INSERT OR IGNORE INTO jobs (title, company, location, description, description_hash, link, dedup_key, search_url, source) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'stepstone')"
+)
+
+def connect_for_writing(db_path, busy_timeout=10.0):
+    """
+    Short-lived connection for bulk writes: WAL journal (readers such as the dashboard are not
+    blocked by the writer), synchronous=NORMAL (safe with WAL, no fsync per commit) and a busy
+    timeout instead of immediate "database is locked" errors.
+    """
+    conn = sqlite3.connect(db_path, timeout=busy_timeout)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={int(busy_timeout * 1000)}")
+    return conn
+
+
+class JobWriter:
+    """
+    Single database writer for scraped jobs. Scraper workers hand rows to add() from any
+    thread; one background thread buffers them and inserts them with executemany, one
+    transaction per flush. A flush happens once batch_size rows are buffered or the oldest
+    buffered row is flush_interval seconds old.
+
+    The writer also owns the set of known dedup keys, so workers can claim() a job before
+    fetching its detail page; keys of rows that failed to insert are released again. Likewise
+    find_repost() tells whether a job is a repost of a stored or already crawled job (same
+    near-duplicate title key), whose description can be reused instead of fetching the page.
+
+    on_flush: optional callable(jobs) called from the writer thread after every successful
+    flush with the stored rows (id, title, description, description_hash, company, cluster_id), e.g. to
+    stream them into the filter. With max_queued, add() blocks once that many jobs wait.
+    """
+
+    def __init__(self, db_path="data/jobs.db", batch_size=50, flush_interval=1.0, on_flush=None, max_queued=0):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+        self.write_seconds = []  # Duration of every flush, for benchmarks
+        self.rows_written = 0
+        self.lock = threading.Lock()
+        self.existing_keys = self._load_existing_keys()
+        self.title_keys = self._load_title_keys()
+        self.crawled_descriptions = {}  # Title key -> (description, description_hash) of jobs added in this run
+        self.queue = queue.Queue(maxsize=max_queued)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _load_existing_keys(self):
+        # Deleted jobs are included: the unique dedup_key index would ignore them anyway
+        with sqlite3.connect(self.db_path) as conn:
+            return set(row[0] for row in conn.execute("SELECT dedup_key FROM jobs WHERE dedup_key IS NOT NULL"))
+
+    def _load_title_keys(self):
+        with sqlite3.connect(self.db_path) as conn:
+            return set(row[0] for row in conn.execute("SELECT DISTINCT title_key FROM jobs WHERE title_key IS NOT NULL AND description != ''"))
+
+    def find_repost(self, key):
+        """(description, description_hash) of a stored or already added job with this title key, or None."""
+        with self.lock:
+            known = self.crawled_descriptions.get(key)
+            if known is not None or key not in self.title_keys:
+                return known
+        with sqlite3.connect(self.db_path) as conn:
+            return conn.execute(
+                "SELECT description, description_hash FROM jobs WHERE title_key = ? AND description != '' ORDER BY id LIMIT 1", (key,)
+            ).fetchone()
+
+    def claim(self, title, company):
+        """Return True and remember the key if no job with this title and company is known yet."""
+        key = dedup_key(title, company)
+        with self.lock:
+            if key in self.existing_keys:
+                return False
+            self.existing_keys.add(key)
+            return True
+
+    def add(self, job):
+        """Queue a job dict with title, company, location, description(_hash), link and search_url for insertion."""
+        if job.get('description'):
+            key = title_key(job['title'], job['company'], job.get('location'))
+            with self.lock:
+                self.crawled_descriptions.setdefault(key, (job['description'], job.get('description_hash')))
+        self.queue.put(job)
+
+    def _run(self):
+        buffer = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                job = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                job = False  # Flush interval elapsed
+            if job:
+                if not buffer:
+                    deadline = time.monotonic() + self.flush_interval
+                buffer.append(job)
+            if buffer and (not job or len(buffer) >= self.batch_size):
+                self._flush(buffer)
+                buffer, deadline = [], None
+            if job is None:
+                return
+
+    def _flush(self, jobs):
+        start = time.perf_counter()
+        rows = [(job['title'], job['company'], job['location'], job['description'], job.get('description_hash'), job['link'],
+                 dedup_key(job['title'], job['company']), job.get('search_url'))
+                for job in jobs]
+        stored = None
+        conn = connect_for_writing(self.db_path)
+        try:
+            with conn:
+                conn.executemany(INSERT_JOB_SQL, rows)
+                # Same transaction: the relevance ranker's term statistics always match the jobs table
+                update_term_stats(conn)
+                update_clusters(conn)
+            self.rows_written += len(rows)
+            if self.on_flush is not None:
+                keys = [row[6] for row in rows]
+                conn.row_factory = sqlite3.Row
+                stored = [dict(row) for row in conn.execute(
+                    f"SELECT id, title, description, description_hash, company, cluster_id FROM jobs WHERE dedup_key IN ({','.join('?' * len(keys))})",
+                    keys
+                )]
+        except sqlite3.Error as e:
+            print(f"DB insert error for {len(rows)} jobs: {e}")
+            # Let a later page pick these jobs up again
+            with self.lock:
+                for job in jobs:
+                    self.existing_keys.discard(dedup_key(job['title'], job['company']))
+        finally:
+            conn.close()
+        self.write_seconds.append(time.perf_counter() - start)
+        profiling.observe("sqlite.job_flush", self.write_seconds[-1])
+        if stored:
+            self.on_flush(stored)
+
+    def close(self):
+        """Write all queued jobs and stop the writer thread."""
+        self.queue.put(None)
+        self.thread.join()
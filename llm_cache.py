@@ -0,0 +1,90 @@
+import hashlib
+import json
+import sqlite3
+from collections import Counter
+
+
+class LLMCache:
+    """
+    Persistent per-job verdict cache stored in the llm_cache table (see initialize_database).
+
+    Each entry is keyed by a hash of the model, the system prompt and the inputs that decide
+    a single job's verdict, so a job hits the cache no matter which batch it ends up in.
+    """
+
+    def __init__(self, db_path="data/jobs.db", max_entries=100000, max_age_days=30):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.hits = Counter()
+        self.misses = Counter()
+
+    @staticmethod
+    def make_key(model, system_prompt, job_inputs):
+        """Fingerprint of everything that determines one job's verdict in one step."""
+        payload = json.dumps([model, system_prompt, job_inputs], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get_many(self, step, keys):
+        """Return a dict of cache_key -> verdict for all keys found in the cache."""
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            # Stay below SQLite's bound-parameter limit
+            for i in range(0, len(unique_keys), 500):
+                chunk = unique_keys[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                cursor.execute(f"SELECT cache_key, verdict FROM llm_cache WHERE cache_key IN ({placeholders})", chunk)
+                found.update(cursor.fetchall())
+            if found:
+                cursor.executemany(
+                    "UPDATE llm_cache SET hits = hits + 1, last_used_at = CURRENT_TIMESTAMP WHERE cache_key = ?",
+                    [(key,) for key in found]
+                )
+            conn.commit()
+        hit_count = sum(1 for key in keys if key in found)
+        self.hits[step] += hit_count
+        self.misses[step] += len(keys) - hit_count
+        return found
+
+    def put_many(self, step, verdicts):
+        """Store verdicts, a dict of cache_key -> 0/1."""
+        if not verdicts:
+            return
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO llm_cache (cache_key, step, verdict) VALUES (?, ?, ?)",
+                [(key, step, int(verdict)) for key, verdict in verdicts.items()]
+            )
+            conn.commit()
+
+    def evict(self):
+        """Drop entries older than max_age_days, then the least recently used ones above max_entries."""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            removed = 0
+            if self.max_age_days:
+                cursor.execute(
+                    "DELETE FROM llm_cache WHERE created_at < datetime('now', ?)",
+                    (f"-{int(self.max_age_days)} days",)
+                )
+                removed += cursor.rowcount
+            if self.max_entries:
+                cursor.execute("""
+                    DELETE FROM llm_cache WHERE cache_key IN (
+                        SELECT cache_key FROM llm_cache ORDER BY last_used_at DESC, rowid DESC LIMIT -1 OFFSET ?
+                    )
+                """, (int(self.max_entries),))
+                removed += cursor.rowcount
+            conn.commit()
+        if removed:
+            print(f"LLM cache: evicted {removed} entries.")
+        return removed
+
+    def report(self):
+        """Print hit/miss counters for this run."""
+        for step in sorted(set(self.hits) | set(self.misses)):
+            total = self.hits[step] + self.misses[step]
+            rate = self.hits[step] / total * 100 if total else 0
+            print(f"LLM cache {step}: {self.hits[step]} hits, {self.misses[step]} misses ({rate:.0f}% hit rate)")
@@ -0,0 +1,199 @@
+import json
+import re
+import threading
+import time
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ENTRY_PATTERN = re.compile(r"\[(\d+)\] Title:")
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    """
+    Minimal stand-in for the OpenAI chat completions endpoint.
+    Every request is answered after `server.latency` seconds with all job numbers found in the prompt.
+    Also serves the parts of the files and batches API the Batch mode uses (see MockOpenAIServer).
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _read_upload(self):
+        """Content of the `file` field of a multipart/form-data upload."""
+        length = int(self.headers.get('Content-Length', 0))
+        header = f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode('utf-8')
+        message = BytesParser(policy=policy.default).parsebytes(header + self.rfile.read(length))
+        for part in message.iter_parts():
+            if part.get_param('name', header='content-disposition') == 'file':
+                return part.get_payload(decode=True)
+        return b''
+
+    def do_POST(self):
+        path = self.path.rstrip('/')
+        if path.endswith('/chat/completions'):
+            request = self._read_json()
+            if self.server.take_chat_failure():
+                self._send_json(429, {"error": {"message": "Rate limit reached (mock)", "type": "requests", "code": "rate_limit_exceeded"}})
+                return
+            self._send_json(200, self.server.complete(request))
+        elif path.endswith('/files'):
+            self._send_json(200, self.server.upload(self._read_upload()))
+        elif path.endswith('/batches'):
+            self._send_json(200, self.server.create_batch(self._read_json()))
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_GET(self):
+        parts = self.path.rstrip('/').split('/')
+        if len(parts) >= 3 and parts[-3] == 'files' and parts[-1] == 'content' and parts[-2] in self.server.files:
+            body = self.server.files[parts[-2]]
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif len(parts) >= 2 and parts[-2] == 'batches' and parts[-1] in self.server.batches:
+            self._send_json(200, self.server.poll_batch(parts[-1]))
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+
+class MockOpenAIServer(ThreadingHTTPServer):
+    """
+    The first chat_failures chat requests are answered with a 429 rate limit error, to exercise
+    retries. Batches are answered like chat requests. A batch reports `in_progress` for
+    batch_polls status checks and is then `completed`; the first batch_failures requests (over
+    all batches) get an error response instead of an answer, to exercise resubmission.
+    """
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.2, batch_polls=1, batch_failures=0, chat_failures=0):
+        super().__init__(('127.0.0.1', port), MockOpenAIHandler)
+        self.latency = latency
+        self.request_count = 0
+        self.batch_polls = batch_polls
+        self.batch_failures = batch_failures
+        self.chat_failures = chat_failures
+        self.files = {}
+        self.batches = {}
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def complete(self, request):
+        """Build a chat completion response for a request body."""
+        with self.lock:
+            self.request_count += 1
+        time.sleep(self.latency)
+        prompt = " ".join(message.get('content', '') for message in request.get('messages', []))
+        content = ",".join(ENTRY_PATTERN.findall(prompt))
+        prompt_tokens = len(prompt) // 4 + 1
+        completion_tokens = len(content) // 4 + 1
+        return {
+            "id": f"chatcmpl-mock-{self.request_count}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get('model', 'mock'),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        }
+
+    def take_chat_failure(self):
+        with self.lock:
+            fail = self.chat_failures > 0
+            self.chat_failures -= fail
+            return fail
+
+    def upload(self, content):
+        with self.lock:
+            file_id = f"file-mock-{len(self.files) + 1}"
+            self.files[file_id] = content
+        return {"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+                "filename": f"{file_id}.jsonl", "purpose": "batch", "status": "processed"}
+
+    def create_batch(self, request):
+        """Answer all requests of the input file right away; poll_batch reveals the result later."""
+        lines = []
+        for line in self.files[request['input_file_id']].decode('utf-8').splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            with self.lock:
+                fail = self.batch_failures > 0
+                self.batch_failures -= fail
+            if fail:
+                response = {"status_code": 500, "body": {"error": {"message": "mock failure"}}}
+            else:
+                response = {"status_code": 200, "body": self.complete(item['body'])}
+            lines.append(json.dumps({"id": f"batch-req-{len(lines)}", "custom_id": item['custom_id'], "response": response, "error": None}))
+        with self.lock:
+            batch_id = f"batch-mock-{len(self.batches) + 1}"
+            output_file_id = f"file-mock-{len(self.files) + 1}"
+            self.files[output_file_id] = ("\n".join(lines) + "\n").encode('utf-8')
+            self.batches[batch_id] = {
+                "id": batch_id, "object": "batch", "endpoint": request.get('endpoint'), "errors": None,
+                "input_file_id": request['input_file_id'], "completion_window": request.get('completion_window'),
+                "status": "in_progress", "output_file_id": None, "error_file_id": None, "created_at": int(time.time()),
+                "request_counts": {"total": len(lines), "completed": 0, "failed": 0},
+                "metadata": request.get('metadata'), "polls_left": self.batch_polls, "result_file_id": output_file_id,
+            }
+            return self._batch_view(batch_id)
+
+    def poll_batch(self, batch_id):
+        with self.lock:
+            batch = self.batches[batch_id]
+            if batch['status'] == 'in_progress':
+                if batch['polls_left'] > 0:
+                    batch['polls_left'] -= 1
+                else:
+                    failed = sum(1 for line in self.files[batch['result_file_id']].splitlines() if b'"status_code": 500' in line)
+                    batch['status'] = 'completed'
+                    batch['output_file_id'] = batch['result_file_id']
+                    batch['request_counts'] = {"total": batch['request_counts']['total'],
+                                               "completed": batch['request_counts']['total'] - failed, "failed": failed}
+            return self._batch_view(batch_id)
+
+    def _batch_view(self, batch_id):
+        return {key: value for key, value in self.batches[batch_id].items() if key not in ('polls_left', 'result_file_id')}
+
+
+def start_mock_server(port=0, latency=0.2, batch_polls=1, batch_failures=0, chat_failures=0):
+    """Start a mock OpenAI server in a background thread and return it."""
+    server = MockOpenAIServer(port, latency, batch_polls, batch_failures, chat_failures)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Local mock OpenAI endpoint")
+    parser.add_argument('--port', type=int, default=8011)
+    parser.add_argument('--latency', type=float, default=0.2, help='Seconds to wait before answering each request')
+    parser.add_argument('--chat-failures', type=int, default=0, help='Answer the first N chat requests with a 429 error')
+    args = parser.parse_args()
+    server = MockOpenAIServer(args.port, args.latency, chat_failures=args.chat_failures)
+    print(f"Mock OpenAI endpoint listening on {server.base_url}")
+    server.serve_forever()
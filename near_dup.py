@@ -0,0 +1,140 @@
+import hashlib
+import re
+import sqlite3
+
+from ranker import tokenize
+from text_keys import GENDER_TAG_PATTERN, dedup_key
+
+# Words that mark a title suffix as location or work mode rather than part of the job name
+REMOTE_WORDS = {'remote', 'homeoffice', 'home', 'office', 'hybrid', 'vor', 'ort', 'onsite', 'mobil', 'deutschlandweit', 'bundesweit'}
+# "Python Developer - Berlin", "Python Developer | Remote", "Python Developer in Berlin", "Python Developer (Hamburg)"
+SUFFIX_PATTERN = re.compile(r"\s*(?:\s[-–|]\s|\sin\s|\()([^-–|()]*)\)?\s*$", re.IGNORECASE)
+
+# SimHash: 64 bits, split into 4 bands of 16 bits for the LSH lookup. Two fingerprints that
+# differ in at most 3 bits agree in at least one band, so the band lookup finds every near duplicate.
+SIMHASH_BITS = 64
+BANDS = 4
+BAND_BITS = SIMHASH_BITS // BANDS
+MAX_HAMMING_DISTANCE = 3
+SHINGLE_SIZE = 3
+# Shorter descriptions (e.g. pages that could not be loaded) are clustered by title key only
+MIN_SIMHASH_TOKENS = 20
+
+
+def strip_title_suffixes(title, location=None):
+    """Remove gender tags and trailing location / work mode suffixes from a job title."""
+    title = GENDER_TAG_PATTERN.sub(' ', title or '').strip()
+    location_words = set(tokenize(location))
+    while True:
+        match = SUFFIX_PATTERN.search(title)
+        if not match:
+            return title
+        words = set(tokenize(match.group(1)))
+        if not words or not words <= location_words | REMOTE_WORDS:
+            return title
+        title = title[:match.start()].strip()
+
+
+def title_key(title, company, location=None):
+    """
+    Key shared by reposts of the same job by the same company whose titles only differ in
+    gender tags, punctuation or location / remote suffixes.
+    """
+    return dedup_key(strip_title_suffixes(title, location), company)
+
+
+def simhash(text):
+    """64-bit SimHash over word 3-grams of a description, or None if the text is too short."""
+    import numpy as np
+
+    tokens = tokenize(text)
+    if len(tokens) < MIN_SIMHASH_TOKENS:
+        return None
+    shingles = {" ".join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)}
+    digests = b"".join(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest() for shingle in shingles)
+    # One row of 64 bits per shingle; a bit of the fingerprint is set if most shingles have it set
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(len(shingles), 8), axis=1)
+    votes = bits.sum(axis=0) * 2 > len(shingles)
+    value = int.from_bytes(np.packbits(votes).tobytes(), 'big')
+    # SQLite integers are signed 64-bit
+    return value - (1 << SIMHASH_BITS) if value >= 1 << (SIMHASH_BITS - 1) else value
+
+
+def simhash_bands(value):
+    unsigned = value & ((1 << SIMHASH_BITS) - 1)
+    return [(unsigned >> (band * BAND_BITS)) & ((1 << BAND_BITS) - 1) for band in range(BANDS)]
+
+
+def hamming_distance(a, b):
+    return bin((a ^ b) & ((1 << SIMHASH_BITS) - 1)).count('1')
+
+
+def find_cluster(conn, key, fingerprint):
+    """Cluster id of a clustered job with the same title key or a near-identical description, or None."""
+    row = conn.execute("SELECT cluster_id FROM jobs WHERE title_key = ? AND cluster_id IS NOT NULL LIMIT 1", (key,)).fetchone()
+    if row:
+        return row[0]
+    if fingerprint is None:
+        return None
+    for band, band_value in enumerate(simhash_bands(fingerprint)):
+        for candidate, cluster_id in conn.execute("""
+            SELECT j.simhash, j.cluster_id FROM simhash_bands b JOIN jobs j ON j.id = b.job_id
+            WHERE b.band = ? AND b.value = ? AND j.cluster_id IS NOT NULL
+        """, (band, band_value)):
+            if hamming_distance(candidate, fingerprint) <= MAX_HAMMING_DISTANCE:
+                return cluster_id
+    return None
+
+
+def update_clusters(conn):
+    """
+    Assign a near-duplicate cluster to every job that has none yet: the cluster of a job with
+    the same title key or a description SimHash at most MAX_HAMMING_DISTANCE bits away, else a
+    new cluster named after the job's own id. Fingerprints and LSH bands are stored in the
+    database, so each job is fingerprinted once. The caller must hold the write lock.
+    Returns (jobs clustered, jobs that joined an existing cluster).
+    """
+    rows = conn.execute("SELECT id, title, company, location, description FROM jobs WHERE cluster_id IS NULL ORDER BY id").fetchall()
+    joined = 0
+    for job_id, title, company, location, description in rows:
+        key = title_key(title, company, location)
+        fingerprint = simhash(description)
+        cluster_id = find_cluster(conn, key, fingerprint)
+        if cluster_id is None:
+            cluster_id = job_id
+        else:
+            joined += 1
+        conn.execute("UPDATE jobs SET title_key = ?, simhash = ?, cluster_id = ? WHERE id = ?", (key, fingerprint, cluster_id, job_id))
+        if fingerprint is not None:
+            conn.executemany("INSERT INTO simhash_bands (band, value, job_id) VALUES (?, ?, ?)",
+                             [(band, band_value, job_id) for band, band_value in enumerate(simhash_bands(fingerprint))])
+    return len(rows), joined
+
+
+# A stored verdict only says something about a step if the job reached it, i.e. passed the step before
+PREVIOUS_STEP = {'step2_homeoffice': 'step1_basic', 'step3_interest': 'step2_homeoffice'}
+
+
+def load_cluster_verdicts(cluster_ids, config_hash, db_path="data/jobs.db"):
+    """
+    Description step verdicts already stored for jobs of the given clusters with the current
+    filter config: {filter step: {cluster id: verdict}}. Used to answer a repost without calling
+    GPT again. Step 1 judges the title, which differs between reposts, so it is not shared.
+    """
+    job_verdicts = {}
+    cluster_ids = list(set(cluster_ids))
+    with sqlite3.connect(db_path) as conn:
+        for start in range(0, len(cluster_ids), 500):
+            chunk = cluster_ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for job_id, cluster_id, step, value in conn.execute(f"""
+                SELECT j.id, j.cluster_id, jf.filter_type, jf.value FROM jobs j JOIN job_filters jf ON jf.job_id = j.id
+                WHERE j.cluster_id IN ({placeholders}) AND jf.config_hash = ? AND jf.filter_type != 'analyzed'
+            """, chunk + [config_hash]):
+                job_verdicts.setdefault((job_id, cluster_id), {})[step] = value
+    verdicts = {}
+    for (_, cluster_id), steps in job_verdicts.items():
+        for step, previous_step in PREVIOUS_STEP.items():
+            if step in steps and steps.get(previous_step) == 1:
+                verdicts.setdefault(step, {})[cluster_id] = steps[step]
+    return verdicts
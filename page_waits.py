@@ -0,0 +1,122 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+import profiling
+
+# Snapshot of everything that changes while a page is still loading: document state, number of
+# matching elements, number of finished network requests (Resource Timing API) and text size.
+PAGE_STATE_SCRIPT = """
+var selector = arguments[0];
+return [
+    document.readyState,
+    selector ? document.querySelectorAll(selector).length : 0,
+    performance.getEntriesByType('resource').length,
+    document.body ? document.body.textContent.length : 0
+];
+"""
+
+
+def wait_for_page_ready(driver, selector=None, timeout=10, quiet_period=0.5, empty_grace=2.0, poll_interval=0.1):
+    """
+    Wait until the current page is ready instead of sleeping for a fixed time.
+
+    The page counts as ready once the DOM is parsed, at least one `selector` element exists and
+    the element count, finished network requests and text size have not changed for `quiet_period`
+    seconds (network idle). A page that stays without matching elements for `empty_grace` seconds
+    is treated as empty (e.g. past the last results page).
+
+    Returns (elapsed_seconds, timed_out, element_count).
+    """
+    start = time.monotonic()
+    last_state = None
+    stable_since = start
+    count = 0
+    while True:
+        now = time.monotonic()
+        try:
+            ready_state, count, resources, text_length = driver.execute_script(PAGE_STATE_SCRIPT, selector)
+        except Exception:
+            # The page may be navigating; treat it as still loading
+            ready_state, count, resources, text_length = 'loading', 0, 0, 0
+        state = (ready_state, count, resources, text_length)
+        if state != last_state:
+            last_state = state
+            stable_since = now
+        stable_for = now - stable_since
+        if ready_state != 'loading':
+            if (count > 0 or selector is None) and stable_for >= quiet_period:
+                return now - start, False, count
+            if count == 0 and selector is not None and stable_for >= empty_grace:
+                return now - start, False, count
+        if now - start >= timeout:
+            return now - start, True, count
+        time.sleep(poll_interval)
+
+
+class PageTimings:
+    """
+    Thread-safe record of per-page timings (navigation, readiness wait, extraction) with an
+    adaptive pause: when pages become slow or time out, a growing pause is inserted before the
+    next navigation; when they are fast again, the pause shrinks back to zero.
+    """
+
+    def __init__(self, slow_threshold=3.0, max_backoff=8.0):
+        self.slow_threshold = slow_threshold
+        self.max_backoff = max_backoff
+        self.backoff = 0.0
+        self.records = []
+        self.lock = threading.Lock()
+
+    def record(self, kind, url, navigate=0.0, wait=0.0, extract=0.0, timed_out=False):
+        for part, seconds in (('navigate', navigate), ('wait', wait), ('extract', extract)):
+            if seconds:
+                profiling.observe(f"page.{kind}.{part}", seconds)
+        with self.lock:
+            self.records.append({
+                'kind': kind,
+                'url': url,
+                'navigate': round(navigate, 3),
+                'wait': round(wait, 3),
+                'extract': round(extract, 3),
+                'timed_out': timed_out,
+            })
+            if timed_out or navigate + wait > self.slow_threshold:
+                self.backoff = min(self.max_backoff, max(0.5, self.backoff * 2))
+            elif self.backoff < 0.1:
+                self.backoff = 0.0
+            else:
+                self.backoff /= 2
+
+    def pause(self):
+        """Sleep for the current backoff; no-op while the site responds quickly."""
+        with self.lock:
+            backoff = self.backoff
+        if backoff:
+            time.sleep(backoff)
+
+    def summary(self):
+        """Print totals per page kind so it is visible where the crawl time goes."""
+        by_kind = defaultdict(list)
+        with self.lock:
+            for record in self.records:
+                by_kind[record['kind']].append(record)
+        if not by_kind:
+            return
+        print(f"{'page kind':<16} {'pages':>6} {'navigate s':>11} {'wait s':>8} {'extract s':>10} {'avg total s':>12} {'timeouts':>9}")
+        for kind, records in sorted(by_kind.items()):
+            navigate = sum(r['navigate'] for r in records)
+            wait = sum(r['wait'] for r in records)
+            extract = sum(r['extract'] for r in records)
+            timeouts = sum(1 for r in records if r['timed_out'])
+            average = (navigate + wait + extract) / len(records)
+            print(f"{kind:<16} {len(records):>6} {navigate:>11.1f} {wait:>8.1f} {extract:>10.1f} {average:>12.2f} {timeouts:>9}")
+
+    def save(self, path="data/page_timings.json"):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self.lock:
+            records = list(self.records)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(records, f, indent=2)
@@ -0,0 +1,70 @@
+import queue
+import threading
+import time
+
+
+class StreamingFilter:
+    """
+    Filter stage of the streaming scrape -> filter pipeline.
+
+    Jobs (dicts with DB ids) are handed over with add_many() as soon as the JobWriter has stored
+    them. A background thread collects them into batches of `batch_size` jobs, or fewer once
+    `max_wait` seconds passed without a full batch, and runs `process_batch(jobs)` on each, so
+    GPT classification overlaps the crawl. The queue is bounded: when filtering falls behind,
+    add_many() blocks and the backpressure reaches the writer instead of piling up jobs.
+    """
+
+    def __init__(self, process_batch, batch_size=50, max_wait=10.0, max_queued=500):
+        self.process_batch = process_batch
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.queue = queue.Queue(maxsize=max_queued)
+        self.error = None
+        self.jobs_filtered = 0
+        self.batches = 0
+        self.busy_seconds = 0.0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def add_many(self, jobs):
+        for job in jobs:
+            self.queue.put(job)
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                job = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                job = False  # max_wait elapsed
+            if job:
+                if not batch:
+                    deadline = time.monotonic() + self.max_wait
+                batch.append(job)
+            if batch and (not job or len(batch) >= self.batch_size):
+                self._process(batch)
+                batch, deadline = [], None
+            if job is None:
+                return
+
+    def _process(self, batch):
+        if self.error is not None:
+            return  # Keep draining the queue so producers do not block, but stop calling the API
+        start = time.perf_counter()
+        try:
+            self.process_batch(batch)
+            self.jobs_filtered += len(batch)
+            self.batches += 1
+        except BaseException as e:  # FilterError after failed retries, or an interrupt
+            print(f"Streaming filter stopped after {self.jobs_filtered} jobs: {e!r}")
+            self.error = e
+        self.busy_seconds += time.perf_counter() - start
+
+    def close(self):
+        """Filter the remaining jobs, stop the thread and re-raise an error from the filter, if any."""
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
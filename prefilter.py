@@ -0,0 +1,97 @@
+import re
+
+from text_keys import UMLAUTS
+
+# English config terms and the German/English spellings they appear as in job titles
+TERM_VARIANTS = {
+    'senior': ['senior', 'sr'],
+    'junior': ['junior', 'jr'],
+    'lead': ['lead', 'leiter', 'leiterin', 'leitung'],
+    'manager': ['manager', 'managerin'],
+    'director': ['director', 'direktor', 'direktorin'],
+    'architect': ['architect', 'architekt', 'architektin'],
+    'expert': ['expert', 'experte', 'expertin'],
+    'principal': ['principal'],
+    'staff': ['staff'],
+    'head': ['head of'],
+    'graduate': ['graduate', 'absolvent', 'absolventin', 'hochschulabsolvent', 'hochschulabsolventin'],
+    'trainee': ['trainee'],
+    'entry level': ['entry level', 'berufseinsteiger', 'berufseinsteigerin', 'einsteiger', 'einsteigerin'],
+    'internship': ['internship', 'intern', 'praktikum', 'praktikant', 'praktikantin'],
+    'educational training': ['educational training', 'ausbildung', 'auszubildende', 'auszubildender', 'azubi'],
+    'working student': ['working student', 'werkstudent', 'werkstudentin'],
+}
+
+# German variants that also match as the last part of a compound noun (Teamleiter, Softwarearchitekt, ...)
+COMPOUND_VARIANTS = {
+    'leiter', 'leiterin', 'leitung', 'manager', 'managerin', 'direktor', 'direktorin',
+    'architekt', 'architektin', 'experte', 'expertin', 'praktikant', 'praktikantin',
+    'absolvent', 'absolventin', 'einsteiger', 'einsteigerin', 'werkstudent', 'werkstudentin',
+}
+
+def normalize_title(text):
+    """Lowercase, fold umlauts and treat hyphens, slashes and dots as spaces."""
+    text = text.lower().translate(UMLAUTS)
+    text = re.sub(r'[-/_.,;:()\[\]|]+', ' ', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def compile_terms(terms):
+    """
+    Compile all variants of `terms` into one regex. Returns (pattern, variant -> term) or
+    (None, {}) for an empty term list.
+    """
+    variant_terms = {}
+    for term in terms:
+        normalized = normalize_title(term)
+        if not normalized:
+            continue
+        for variant in TERM_VARIANTS.get(normalized, [normalized]):
+            variant_terms.setdefault(normalize_title(variant), term)
+    if not variant_terms:
+        return None, {}
+    alternatives = []
+    # Longest variants first so 'entry level' wins over a shorter overlapping variant
+    for variant in sorted(variant_terms, key=len, reverse=True):
+        escaped = re.escape(variant).replace(r'\ ', r'\s')
+        left = '' if variant in COMPOUND_VARIANTS else r'(?<![a-z0-9])'
+        alternatives.append(f"{left}{escaped}(?![a-z0-9])")
+    return re.compile("|".join(alternatives)), variant_terms
+
+
+class TitlePrefilter:
+    """
+    Local, deterministic decision for the step 1 title filter.
+
+    Titles containing an avoid term (in any known German/English variant) are rejected,
+    titles containing only include terms are accepted, and everything else, including titles
+    that match both, is left to GPT.
+    """
+
+    def __init__(self, avoid_terms, include_terms=None):
+        self.avoid_pattern, self.avoid_variants = compile_terms(avoid_terms)
+        self.include_pattern, self.include_variants = compile_terms(include_terms or [])
+
+    def classify(self, title):
+        """Return ('reject' | 'accept' | 'ambiguous', matched term or None)."""
+        normalized = normalize_title(title)
+        avoid = self.avoid_pattern.search(normalized) if self.avoid_pattern else None
+        include = self.include_pattern.search(normalized) if self.include_pattern else None
+        if avoid and not include:
+            return 'reject', self.avoid_variants[normalize_title(avoid.group())]
+        if include and not avoid:
+            return 'accept', self.include_variants[normalize_title(include.group())]
+        return 'ambiguous', None
+
+    def split(self, jobs):
+        """Split jobs into (accepted, rejected, ambiguous) lists, keeping their order."""
+        accepted, rejected, ambiguous = [], [], []
+        for job in jobs:
+            verdict, _ = self.classify(job['title'])
+            if verdict == 'accept':
+                accepted.append(job)
+            elif verdict == 'reject':
+                rejected.append(job)
+            else:
+                ambiguous.append(job)
+        return accepted, rejected, ambiguous
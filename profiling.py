@@ -0,0 +1,179 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+
+# Upper bounds (seconds) of the latency histogram buckets, as in a Prometheus histogram
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Profiler:
+    """
+    Run instrumentation: stage timers (how long each part of the pipeline took in total),
+    latency samples per request kind (page loads, HTTP detail pages, OpenAI calls, SQLite
+    commits) and the prompt/completion tokens OpenAI reported per filter step.
+
+    Thread-safe; the scraper's browser workers, the writer thread and the filter's request
+    threads all report into the same profiler.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.stages = defaultdict(list)
+        self.latencies = defaultdict(list)
+        self.tokens = defaultdict(Counter)
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            with self.lock:
+                self.stages[name].append(duration)
+
+    def observe(self, name, seconds):
+        with self.lock:
+            self.latencies[name].append(seconds)
+
+    def add_usage(self, step, usage):
+        """Count the tokens of one API response (its `usage` object, may be None)."""
+        with self.lock:
+            counts = self.tokens[step]
+            counts['requests'] += 1
+            if usage is not None:
+                counts['prompt_tokens'] += getattr(usage, 'prompt_tokens', 0) or 0
+                counts['completion_tokens'] += getattr(usage, 'completion_tokens', 0) or 0
+
+    def report(self):
+        """The run report as a JSON-serializable dict."""
+        with self.lock:
+            stages = {name: list(durations) for name, durations in self.stages.items()}
+            latencies = {name: sorted(samples) for name, samples in self.latencies.items()}
+            tokens = {step: dict(counts) for step, counts in self.tokens.items()}
+        return {
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started_at)),
+            'command': sys.argv,
+            'wall_seconds': round(time.perf_counter() - self.start, 3),
+            'stages': {
+                name: {'count': len(durations), 'total_seconds': round(sum(durations), 3), 'max_seconds': round(max(durations), 3)}
+                for name, durations in sorted(stages.items())
+            },
+            'latencies': {
+                name: {
+                    'count': len(samples),
+                    'total_seconds': round(sum(samples), 4),
+                    'mean_seconds': round(sum(samples) / len(samples), 4),
+                    'p50_seconds': round(percentile(samples, 0.5), 4),
+                    'p95_seconds': round(percentile(samples, 0.95), 4),
+                    'max_seconds': round(samples[-1], 4),
+                    'buckets': histogram(samples),
+                }
+                for name, samples in sorted(latencies.items())
+            },
+            'tokens': tokens,
+        }
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=2)
+
+    def save_prometheus(self, path):
+        """Write the report in the Prometheus text format, e.g. for node_exporter's textfile collector."""
+        report = self.report()
+        lines = [
+            "# HELP jobscraper_run_seconds Wall time of the last run.",
+            "# TYPE jobscraper_run_seconds gauge",
+            f"jobscraper_run_seconds {report['wall_seconds']}",
+            "# HELP jobscraper_stage_seconds Total time spent in each pipeline stage during the last run.",
+            "# TYPE jobscraper_stage_seconds gauge",
+        ]
+        lines += [f'jobscraper_stage_seconds{{stage="{name}"}} {stage["total_seconds"]}' for name, stage in report['stages'].items()]
+        lines += [
+            "# HELP jobscraper_latency_seconds Latency of individual requests and commits during the last run.",
+            "# TYPE jobscraper_latency_seconds histogram",
+        ]
+        for name, latency in report['latencies'].items():
+            for bound, count in latency['buckets'].items():
+                lines.append(f'jobscraper_latency_seconds_bucket{{name="{name}",le="{bound}"}} {count}')
+            lines.append(f'jobscraper_latency_seconds_sum{{name="{name}"}} {latency["total_seconds"]}')
+            lines.append(f'jobscraper_latency_seconds_count{{name="{name}"}} {latency["count"]}')
+        lines += [
+            "# HELP jobscraper_openai_tokens OpenAI tokens used per filter step during the last run.",
+            "# TYPE jobscraper_openai_tokens gauge",
+        ]
+        for step, counts in report['tokens'].items():
+            for kind in ('prompt_tokens', 'completion_tokens'):
+                lines.append(f'jobscraper_openai_tokens{{step="{step}",kind="{kind.split("_")[0]}"}} {counts.get(kind, 0)}')
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # Written to a temporary file first, so a collector never reads a half-written file
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(path + '.tmp', path)
+
+    def summary(self):
+        """Print the stages, latencies and tokens of the run."""
+        report = self.report()
+        print(f"Profile ({report['wall_seconds']:.1f}s wall time):")
+        for name, stage in report['stages'].items():
+            print(f"  {name:<32} {stage['total_seconds']:>9.2f}s  ({stage['count']}x)")
+        for name, latency in report['latencies'].items():
+            print(f"  {name:<32} {latency['count']:>6} x  p50 {latency['p50_seconds'] * 1000:.0f} ms, "
+                  f"p95 {latency['p95_seconds'] * 1000:.0f} ms, max {latency['max_seconds'] * 1000:.0f} ms")
+        for step, counts in report['tokens'].items():
+            print(f"  tokens {step:<25} {counts.get('prompt_tokens', 0):>9} prompt, {counts.get('completion_tokens', 0)} completion "
+                  f"in {counts.get('requests', 0)} requests")
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def histogram(sorted_values):
+    """Cumulative bucket counts keyed by upper bound, the last bucket ("+Inf") counting all values."""
+    buckets = {}
+    position = 0
+    for bound in LATENCY_BUCKETS:
+        while position < len(sorted_values) and sorted_values[position] <= bound:
+            position += 1
+        buckets[str(bound)] = position
+    buckets['+Inf'] = len(sorted_values)
+    return buckets
+
+
+# The profiler of this process, None unless profiling was enabled (--profile)
+_active = None
+
+
+def enable():
+    """Start collecting for this process and return the profiler."""
+    global _active
+    _active = Profiler()
+    return _active
+
+
+def active():
+    return _active
+
+
+def stage(name):
+    """Context manager timing a pipeline stage; does nothing while profiling is off."""
+    return _active.stage(name) if _active is not None else nullcontext()
+
+
+def observe(name, seconds):
+    if _active is not None:
+        _active.observe(name, seconds)
+
+
+def add_usage(step, usage):
+    if _active is not None:
+        _active.add_usage(step, usage)
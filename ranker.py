@@ -0,0 +1,139 @@
+import re
+import sqlite3
+from collections import Counter
+
+from text_keys import UMLAUTS
+
+# Letters, digits and the characters of c++, c#, .net
+TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9+#]*|\.net")
+
+# BM25 parameters (the usual defaults)
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall((text or '').lower().translate(UMLAUTS))
+
+
+def job_tokens(job):
+    """Tokens of a job's title and description; the title is counted twice, it says the most about the job."""
+    title = tokenize(job['title'])
+    return title + title + tokenize(job['description'])
+
+
+def update_term_stats(conn):
+    """
+    Add jobs inserted since the last update to the cached term statistics (document frequency
+    per term, number of jobs, total length). The caller must hold the write lock, e.g. by running
+    this inside the transaction that inserted the jobs, so no job is counted twice.
+    Returns the number of jobs added.
+    """
+    last_job_id, doc_count, total_length = conn.execute(
+        "SELECT last_job_id, doc_count, total_length FROM term_stats_state WHERE id = 1"
+    ).fetchone() or (0, 0, 0)
+    doc_freq = Counter()
+    new_jobs = 0
+    for job_id, title, description in conn.execute(
+        "SELECT id, title, description FROM jobs WHERE id > ? ORDER BY id", (last_job_id,)
+    ).fetchall():
+        tokens = job_tokens({'title': title, 'description': description})
+        doc_freq.update(set(tokens))
+        total_length += len(tokens)
+        doc_count += 1
+        last_job_id = job_id
+        new_jobs += 1
+    if not new_jobs:
+        return 0
+    conn.executemany("""
+        INSERT INTO term_stats (term, doc_freq) VALUES (?, ?)
+        ON CONFLICT(term) DO UPDATE SET doc_freq = doc_freq + excluded.doc_freq
+    """, doc_freq.items())
+    conn.execute("""
+        INSERT OR REPLACE INTO term_stats_state (id, last_job_id, doc_count, total_length) VALUES (1, ?, ?, ?)
+    """, (last_job_id, doc_count, total_length))
+    return new_jobs
+
+
+def refresh_term_stats(db_path="data/jobs.db"):
+    """Bring the term statistics up to date with the jobs table (jobs inserted by other writers)."""
+    conn = sqlite3.connect(db_path, timeout=10.0)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        added = update_term_stats(conn)
+        conn.commit()
+    finally:
+        conn.close()
+    return added
+
+
+class RelevanceRanker:
+    """
+    BM25 relevance of jobs (title and description) to the user's interests, computed locally.
+
+    Document frequencies come from the cached term statistics of all jobs in the database, so
+    a batch of jobs is scored in one vectorized NumPy pass without re-reading the corpus.
+    """
+
+    def __init__(self, interests, db_path="data/jobs.db"):
+        self.db_path = db_path
+        # Multi-word interests ("machine learning") count each of their words
+        self.terms = list(dict.fromkeys(token for interest in interests for token in tokenize(interest)))
+        refresh_term_stats(db_path)
+        with sqlite3.connect(db_path) as conn:
+            _, self.doc_count, self.total_length = conn.execute(
+                "SELECT last_job_id, doc_count, total_length FROM term_stats_state WHERE id = 1"
+            ).fetchone() or (0, 0, 0)
+            placeholders = ",".join("?" * len(self.terms))
+            doc_freq = dict(conn.execute(f"SELECT term, doc_freq FROM term_stats WHERE term IN ({placeholders})", self.terms))
+        self.doc_freq = [doc_freq.get(term, 0) for term in self.terms]
+
+    def score(self, jobs):
+        """Return one BM25 score per job, 0 for jobs that mention none of the interests."""
+        import numpy as np
+
+        if not jobs or not self.terms:
+            return np.zeros(len(jobs))
+        term_freq = np.zeros((len(jobs), len(self.terms)))
+        lengths = np.zeros(len(jobs))
+        for row, job in enumerate(jobs):
+            tokens = job_tokens(job)
+            lengths[row] = len(tokens)
+            counts = Counter(tokens)
+            term_freq[row] = [counts[term] for term in self.terms]
+        doc_count = max(self.doc_count, len(jobs))
+        average_length = self.total_length / self.doc_count if self.doc_count else max(lengths.mean(), 1.0)
+        doc_freq = np.minimum(np.array(self.doc_freq, dtype=float), doc_count)
+        idf = np.log(1.0 + (doc_count - doc_freq + 0.5) / (doc_freq + 0.5))
+        length_norm = K1 * (1 - B + B * lengths / average_length)
+        weights = term_freq * (K1 + 1) / (term_freq + length_norm[:, None])
+        return weights @ idf
+
+    def score_and_store(self, jobs):
+        """Score jobs, store the scores in jobs.relevance_score and return {job id: score}."""
+        scores = {int(job['id']): round(float(score), 4) for job, score in zip(jobs, self.score(jobs))}
+        conn = sqlite3.connect(self.db_path, timeout=10.0)
+        try:
+            with conn:
+                conn.executemany("UPDATE jobs SET relevance_score = ? WHERE id = ?", [(score, job_id) for job_id, score in scores.items()])
+        finally:
+            conn.close()
+        return scores
+
+
+def split_by_relevance(jobs, scores, min_score):
+    """Split jobs into (candidates scoring above min_score, jobs rejected locally)."""
+    candidates, rejected = [], []
+    for job in jobs:
+        (candidates if scores.get(int(job['id']), 0) > min_score else rejected).append(job)
+    return candidates, rejected
+
+
+def describe_scores(scores):
+    """Short distribution summary for the filter log."""
+    values = sorted(scores.values())
+    if not values:
+        return "no jobs"
+    nonzero = sum(1 for value in values if value > 0)
+    median = values[len(values) // 2]
+    return f"{len(values)} jobs, {nonzero} mention an interest, median score {median:.2f}, max {values[-1]:.2f}"
@@ -0,0 +1,82 @@
+import threading
+import time
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at `rate_per_minute`.
+    The bucket starts full, so short bursts up to `capacity` are not delayed.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = float(capacity if capacity is not None else rate_per_minute)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate_per_second)
+        self.updated_at = now
+
+    def acquire(self, amount=1):
+        """Block until `amount` tokens are available and take them."""
+        # A single request larger than the bucket would otherwise wait forever
+        amount = min(float(amount), self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate_per_second
+            time.sleep(wait)
+
+
+class RateLimiter:
+    """
+    Combined requests/min and tokens/min limiter for API calls.
+    Either limit may be None to disable it.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    def acquire(self, tokens=0):
+        if self.requests:
+            self.requests.acquire(1)
+        if self.tokens and tokens:
+            self.tokens.acquire(tokens)
+
+
+class HostThrottle:
+    """
+    Per-host politeness delay: consecutive requests to the same host start at least
+    `delay` seconds apart, no matter how many threads are issuing them. With
+    `requests_per_minute`, every host also gets a token bucket, a request budget shared by
+    everything that uses the same throttle (result pages, detail pages, several searches).
+    """
+
+    def __init__(self, delay=0.5, requests_per_minute=None):
+        self.delay = delay
+        self.requests_per_minute = requests_per_minute
+        self.next_allowed = {}
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def wait(self, url):
+        host = urlparse(url).netloc
+        if self.requests_per_minute:
+            with self.lock:
+                # At most one second's worth of requests as a burst, so the budget is spread over the minute
+                bucket = self.buckets.setdefault(host, TokenBucket(self.requests_per_minute, max(1.0, self.requests_per_minute / 60)))
+            bucket.acquire()
+        with self.lock:
+            now = time.monotonic()
+            start_at = max(now, self.next_allowed.get(host, now))
+            self.next_allowed[host] = start_at + self.delay
+        if start_at > now:
+            time.sleep(start_at - now)
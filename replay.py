@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, urlunparse
+
+MANIFEST = "manifest.json"
+
+
+def page_key(url):
+    """Path and query of a URL; recordings are looked up by this key so any host can serve them."""
+    parsed = urlparse(url)
+    return urlunparse(('', '', parsed.path or '/', '', parsed.query, ''))
+
+
+class PageRecorder:
+    """
+    Saves the HTML of every results and detail page the scraper sees into a directory,
+    together with a manifest mapping page URLs to files. Safe to use from several threads.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.manifest = {'origin': None, 'pages': {}}
+        manifest_path = os.path.join(directory, MANIFEST)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)
+
+    def save(self, url, html, kind):
+        parsed = urlparse(url)
+        key = page_key(url)
+        filename = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16] + ".html"
+        with open(os.path.join(self.directory, filename), 'w', encoding='utf-8') as f:
+            f.write(html)
+        with self.lock:
+            self.manifest['origin'] = self.manifest.get('origin') or f"{parsed.scheme}://{parsed.netloc}"
+            self.manifest['pages'][key] = {'file': filename, 'kind': kind, 'url': url}
+
+    def close(self):
+        with self.lock:
+            with open(os.path.join(self.directory, MANIFEST), 'w', encoding='utf-8') as f:
+                json.dump(self.manifest, f, indent=2)
+        print(f"Recorded {len(self.manifest['pages'])} pages to {self.directory}")
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        html = self.server.load(self.path)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if html is None:
+            # Unknown pages (e.g. past the last recorded results page) render without job cards
+            status, html = 404, "<html><body></body></html>"
+        else:
+            status = 200
+        payload = html.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """
+    Local stand-in for Stepstone that serves recorded pages. Absolute links to the recorded
+    origin are rewritten to the local server, so detail pages are replayed as well.
+    """
+    daemon_threads = True
+
+    def __init__(self, directory, port=0, latency=0.0):
+        super().__init__(('127.0.0.1', port), ReplayHandler)
+        self.directory = directory
+        self.latency = latency
+        with open(os.path.join(directory, MANIFEST), 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def local_url(self, url):
+        """Map a live URL to the same page on the replay server."""
+        return self.base_url + page_key(url)
+
+    def load(self, path):
+        entry = self.manifest['pages'].get(page_key(path))
+        if entry is None:
+            return None
+        with open(os.path.join(self.directory, entry['file']), 'r', encoding='utf-8') as f:
+            html = f.read()
+        origin = self.manifest.get('origin')
+        if origin:
+            html = html.replace(origin, self.base_url)
+        return html
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        print(f"Replaying {len(self.manifest['pages'])} recorded pages from {self.directory} at {self.base_url}")
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
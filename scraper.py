@@ -0,0 +1,488 @@
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, urlunparse, parse_qs, urlencode
+
+import pandas as pd
+from tqdm import tqdm
+from selenium import webdriver
+from selenium.webdriver.common.by import By
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from webdriver_manager.chrome import ChromeDriverManager
+from selenium.webdriver.chrome.service import Service
+from selenium.common.exceptions import TimeoutException, NoSuchElementException, WebDriverException
+
+from browser_pool import BrowserPool
+from descriptions import BOILERPLATE_SELECTOR, clean_description, description_hash
+from database import get_crawl_watermark, save_crawl_watermark
+from ingest import JobWriter
+from near_dup import title_key
+from page_waits import wait_for_page_ready, PageTimings
+from text_keys import dedup_key
+
+
+# Resolved ChromeDriver binary, so webdriver_manager's version lookup runs once instead of every start
+CHROMEDRIVER_CACHE = "data/chromedriver.json"
+# Written into a browser profile once the cookie banner has been accepted in it
+CONSENT_MARKER = "cookie_consent_accepted"
+
+
+def resolve_chromedriver_path(refresh=False):
+    """Return the ChromeDriver path from CHROMEDRIVER_CACHE, asking ChromeDriverManager only if unknown or refresh."""
+    if not refresh:
+        try:
+            with open(CHROMEDRIVER_CACHE, 'r') as f:
+                path = json.load(f)['path']
+            if os.access(path, os.X_OK):
+                return path
+        except (FileNotFoundError, KeyError, json.JSONDecodeError):
+            pass
+    path = ChromeDriverManager().install()
+    os.makedirs(os.path.dirname(CHROMEDRIVER_CACHE), exist_ok=True)
+    with open(CHROMEDRIVER_CACHE, 'w') as f:
+        json.dump({'path': path, 'resolved_at': time.strftime('%Y-%m-%d %H:%M:%S')}, f)
+    return path
+
+
+def initialize_driver(worker_id=0, profile_root=None):
+    """
+    Start headless Chrome. With profile_root, worker `worker_id` uses its own persistent profile
+    (profile_root/worker-N), so cookie consent and the HTTP cache survive between runs.
+    """
+    options = Options()
+    options.add_argument('--headless')
+    # Return from driver.get() once the DOM is parsed; readiness is checked explicitly (see page_waits)
+    options.page_load_strategy = 'eager'
+    profile_dir = None
+    if profile_root:
+        # Chrome locks a profile, so every concurrent worker needs its own
+        profile_dir = os.path.abspath(os.path.join(profile_root, f"worker-{worker_id}"))
+        os.makedirs(profile_dir, exist_ok=True)
+        options.add_argument(f'--user-data-dir={profile_dir}')
+    try:
+        driver = webdriver.Chrome(service=Service(resolve_chromedriver_path()), options=options)
+    except WebDriverException as e:
+        # Usually Chrome updated itself and the cached driver no longer matches
+        print(f"Cached ChromeDriver failed to start ({str(e).splitlines()[0]}), resolving it again.")
+        driver = webdriver.Chrome(service=Service(resolve_chromedriver_path(refresh=True)), options=options)
+    driver.profile_dir = profile_dir  # Read by handle_cookies
+    return driver
+
+
+def scrape_jobs(platform, url, pages=30, detail_fetcher=None, browser_pool=None, recorder=None, writer=None,
+                db_path="data/jobs.db", incremental_stop_pages=0, search_key=None, throttle=None):
+    if platform == 'indeed':
+        return scrape_jobs_from_indeed(url, pages)
+    elif platform == 'stepstone':
+        if isinstance(url, list):
+            return scrape_stepstone_searches(url, pages, db_path, detail_fetcher=detail_fetcher, browser_pool=browser_pool, recorder=recorder, writer=writer,
+                                             incremental_stop_pages=incremental_stop_pages, search_keys=search_key, throttle=throttle)
+        return scrape_jobs_from_stepstone(url, pages, db_path, detail_fetcher=detail_fetcher, browser_pool=browser_pool, recorder=recorder, writer=writer,
+                                          incremental_stop_pages=incremental_stop_pages, search_key=search_key, throttle=throttle)
+
+
+# Accept buttons of the consent banners seen on Stepstone: (CSS selector, required text or None)
+COOKIE_ACCEPT_BUTTONS = [
+    ('#ccmgt_preferences_accept', None),
+    ('#ccmgt_explicit_accept', None),
+    ('div.ccmgt_accept_button', 'Alles akzeptieren'),
+    ('.privacy-prompt-button.primary-button.ccmgt_accept_button', None),
+    ('#onetrust-accept-btn-handler', None),
+]
+
+# Clicks the first visible accept button in one round trip; returns its selector or null
+COOKIE_ACCEPT_SCRIPT = """
+var buttons = arguments[0];
+for (var i = 0; i < buttons.length; i++) {
+    var elements = document.querySelectorAll(buttons[i][0]);
+    for (var j = 0; j < elements.length; j++) {
+        var el = elements[j];
+        if (el.getClientRects().length === 0) continue;
+        if (buttons[i][1] && el.textContent.indexOf(buttons[i][1]) === -1) continue;
+        el.click();
+        return buttons[i][0];
+    }
+}
+return null;
+"""
+
+
+def handle_cookies(driver, timeout=5.0, poll_interval=0.25):
+    """
+    Accept the cookie banner. If the browser profile already accepted it (see initialize_driver),
+    this is a single check without waiting; otherwise the banner is polled for up to `timeout`
+    seconds and the acceptance is remembered in the profile.
+    """
+    profile_dir = getattr(driver, 'profile_dir', None)
+    consent_marker = os.path.join(profile_dir, CONSENT_MARKER) if profile_dir else None
+    remembered = consent_marker is not None and os.path.exists(consent_marker)
+    deadline = time.monotonic() + (0 if remembered else timeout)
+    try:
+        while True:
+            clicked = driver.execute_script(COOKIE_ACCEPT_SCRIPT, COOKIE_ACCEPT_BUTTONS)
+            if clicked:
+                print(f"Cookie button clicked ({clicked}).")
+                if consent_marker is not None:
+                    with open(consent_marker, 'w') as f:
+                        f.write(time.strftime('%Y-%m-%d %H:%M:%S'))
+                return True
+            if time.monotonic() >= deadline:
+                break
+            time.sleep(poll_interval)
+        if not remembered:
+            print("Failed to click cookie button with provided selectors.")
+    except Exception as e:
+        print("An exception occurred while handling cookies:", str(e))
+    return False
+
+
+# Reads all job cards of a results page in the browser and returns them as plain JSON,
+# so a page costs one WebDriver round trip instead of several per card.
+JOB_CARDS_SCRIPT = """
+return Array.from(document.querySelectorAll('article[data-at="job-item"]')).map(function (card) {
+    function text(selector) {
+        var el = card.querySelector(selector);
+        return el ? el.innerText.trim() : '';
+    }
+    var link = card.querySelector('a[data-at="job-item-title"]');
+    return {
+        title: text('h2'),
+        company: text('span[data-at="job-item-company-name"]'),
+        location: text('span[data-at="job-item-location"]'),
+        link: link ? link.href : ''
+    };
+});
+"""
+
+
+# Returns the largest text block (div with more than 500 characters) of a detail page,
+# falling back to the whole body text, in a single round trip. Navigation, footer, cookie
+# banners and "similar jobs" containers are removed first so they cannot win.
+DESCRIPTION_SCRIPT = """
+var boilerplate = document.querySelectorAll(arguments[0]);
+for (var j = 0; j < boilerplate.length; j++) {
+    var element = boilerplate[j];
+    // Same guard as BOILERPLATE_XPATH: never drop the page itself or a region holding the content
+    if (element === document.documentElement || element === document.body ||
+            element.querySelector('main, article, [role="main"]')) {
+        continue;
+    }
+    element.remove();
+}
+var best = '';
+var divs = document.getElementsByTagName('div');
+for (var i = 0; i < divs.length; i++) {
+    var text = divs[i].innerText;
+    if (text && text.length > 500 && text.length > best.length) {
+        best = text;
+    }
+}
+return best || (document.body ? document.body.innerText : '');
+"""
+
+
+def read_job_cards(driver, domain):
+    """Return title, company, location and absolute link of every job card on the current results page."""
+    cards = driver.execute_script(JOB_CARDS_SCRIPT) or []
+    for card in cards:
+        if card['link'].startswith('/'):
+            card['link'] = domain + card['link']
+    return cards
+
+
+def get_description_with_driver(driver, job_link, timings=None, recorder=None):
+    """Load a detail page in the current browser window and return its largest text block."""
+    start = time.monotonic()
+    driver.get(job_link)
+    navigated = time.monotonic()
+    waited, timed_out, _ = wait_for_page_ready(driver, 'article', timeout=5)
+    if timed_out:
+        print(f"Error loading detail page for {job_link}")
+    if recorder is not None:
+        recorder.save(job_link, driver.page_source, 'detail')
+    extract_start = time.monotonic()
+    description = driver.execute_script(DESCRIPTION_SCRIPT, BOILERPLATE_SELECTOR) or ''
+    if timings is not None:
+        timings.record('detail_browser', job_link, navigated - start, waited, time.monotonic() - extract_start, timed_out)
+    return description
+
+
+def get_page_url(url, page):
+    """Return the search URL with its page query parameter set to `page`."""
+    parsed_url = urlparse(url)
+    query_dict = parse_qs(parsed_url.query)
+    query_dict['page'] = [str(page)]
+    new_query = urlencode(query_dict, doseq=True)
+    return urlunparse((parsed_url.scheme, parsed_url.netloc, parsed_url.path, '', new_query, ''))
+
+
+def find_incremental_stop(results, stop_pages):
+    """
+    Return the last page of the first run of `stop_pages` consecutive crawled pages without a
+    new job, or None. Pages still being crawled by another worker interrupt a run.
+    """
+    run = 0
+    for page in range(1, max(results, default=0) + 1):
+        run = run + 1 if results.get(page) == 0 else 0
+        if run >= stop_pages:
+            return page
+    return None
+
+
+def scrape_jobs_from_stepstone(url, pages=1, db_path="data/jobs.db", detail_fetcher=None, browser_pool=None, pool_size=1, timings=None, recorder=None, writer=None,
+                               incremental_stop_pages=0, search_key=None, throttle=None, worker_ids=None, report_timings=True):
+    """
+    Scrape result pages with Selenium and store new jobs in the database.
+
+    detail_fetcher: optional DetailFetcher; detail pages are then fetched over HTTP in parallel
+    and only pages that need JavaScript are loaded in the browser.
+    browser_pool: optional BrowserPool to crawl with; its browsers stay open for later crawls.
+    pool_size: number of browser workers if no pool is given (a temporary pool is created).
+    timings: optional PageTimings collecting per-page timings; a new one is created if omitted.
+    recorder: optional PageRecorder that saves every results and detail page for offline replay.
+    writer: optional JobWriter to insert jobs with; by default one is created for this crawl.
+    incremental_stop_pages: stop paginating after this many consecutive pages without new jobs
+    (0 crawls all pages). Only used once a watermark exists for the search, i.e. the first crawl
+    of a search always goes through all pages.
+    search_key: the search the watermark is stored under and jobs are tagged with (default: url).
+    throttle: optional HostThrottle every results and browser detail page waits for.
+    worker_ids: pool workers to crawl with (default: all), see scrape_stepstone_searches.
+    report_timings: print and save the page timings at the end.
+    """
+    if timings is None:
+        timings = PageTimings()
+    own_pool = browser_pool is None
+    if own_pool:
+        print(f"Initializing {pool_size} web driver(s)...")
+        browser_pool = BrowserPool(pool_size, initialize_driver, handle_cookies)
+    print("Opening URL and handling cookie consent...")
+    first_driver = browser_pool.first_driver(url, worker_ids[0] if worker_ids else 0)
+    if detail_fetcher is not None:
+        detail_fetcher.adopt_browser_session(first_driver)
+
+    # Shared between browser workers
+    seen_lock = threading.Lock()
+
+    # Extract domain from the URL for relative links
+    parsed_url = urlparse(url)
+    domain = f"{parsed_url.scheme}://{parsed_url.netloc}"
+
+    search_key = search_key or url
+    watermark = get_crawl_watermark(search_key, db_path) if incremental_stop_pages else None
+    crawl_state = {'head_key': None, 'head_unchanged': False, 'stop_page': None}
+
+    def stop_when(results):
+        # Page 1 still starts with the same job as last time and has nothing new: the search is unchanged
+        stop_page = 1 if crawl_state['head_unchanged'] else find_incremental_stop(results, incremental_stop_pages)
+        if crawl_state['stop_page'] is None:
+            crawl_state['stop_page'] = stop_page
+        return stop_page
+
+    jobs_data = []
+    # The writer knows every title+company pair in the DB; a job is claimed there before its detail page is fetched
+    own_writer = writer is None
+    if own_writer:
+        writer = JobWriter(db_path)
+
+    def process_page(driver, page, page_url):
+        timings.pause()
+        if throttle is not None:
+            throttle.wait(page_url)
+        start = time.monotonic()
+        driver.get(page_url)
+        navigated = time.monotonic()
+        print("Navigated to:", driver.current_url)
+        waited, timed_out, _ = wait_for_page_ready(driver, 'article[data-at="job-item"]', timeout=10)
+        if recorder is not None:
+            recorder.save(page_url, driver.page_source, 'results')
+        extract_start = time.monotonic()
+        job_cards = read_job_cards(driver, domain)
+        timings.record('results', page_url, navigated - start, waited, time.monotonic() - extract_start, timed_out)
+        if not job_cards:
+            print(f"No job cards found on page {page}. Stopping pagination.")
+            return None
+        # Only cards not yet in the DB (by title+company) are processed
+        page_jobs = [job for job in job_cards if writer.claim(job['title'], job['company'])]
+        if page == 1:
+            crawl_state['head_key'] = dedup_key(job_cards[0]['title'], job_cards[0]['company'])
+            crawl_state['head_unchanged'] = bool(watermark) and not page_jobs and crawl_state['head_key'] == watermark['head_key']
+        print(f"Page {page}: {len(page_jobs)} jobs (by title+company) are not yet in the DB and will be processed.")
+
+        # Reposts (same title key as a stored or crawled job, or as an earlier job on this page)
+        # reuse that job's description; only one detail page per title key is fetched
+        descriptions = {}
+        fetch_jobs, page_reposts, first_by_key = [], [], {}
+        for job in page_jobs:
+            key = title_key(job['title'], job['company'], job.get('location'))
+            known = writer.find_repost(key)
+            if known is not None:
+                descriptions[job['link']] = known[0]
+            elif key in first_by_key:
+                page_reposts.append((job, first_by_key[key]))
+            else:
+                first_by_key[key] = job
+                fetch_jobs.append(job)
+        if len(fetch_jobs) < len(page_jobs):
+            print(f"Page {page}: {len(page_jobs) - len(fetch_jobs)} reposts of known jobs, their detail pages are not fetched.")
+        if detail_fetcher is not None and fetch_jobs:
+            fetch_start = time.monotonic()
+            descriptions.update(detail_fetcher.fetch_many([job['link'] for job in fetch_jobs]))
+            timings.record('detail_http', page_url, extract=time.monotonic() - fetch_start)
+        # Pages that could not be fetched or parsed over HTTP are loaded in a browser tab
+        browser_links = [job['link'] for job in fetch_jobs if not descriptions.get(job['link'])]
+        if detail_fetcher is not None and browser_links:
+            print(f"Falling back to the browser for {len(browser_links)} detail pages.")
+        if browser_links:
+            main_window = driver.current_window_handle
+            driver.execute_script("window.open('');")
+            detail_window = driver.window_handles[-1]
+            driver.switch_to.window(detail_window)
+            for job_link in browser_links:
+                if throttle is not None:
+                    throttle.wait(job_link)
+                try:
+                    descriptions[job_link] = get_description_with_driver(driver, job_link, timings, recorder)
+                except Exception as e:
+                    print(f"Fehler beim Laden der Detailseite: {e}")
+                    descriptions[job_link] = ''
+            driver.close()
+            driver.switch_to.window(main_window)
+        for job, original in page_reposts:
+            descriptions[job['link']] = descriptions.get(original['link'])
+
+        for job_entry in page_jobs:
+            job_entry['description'] = clean_description(descriptions.get(job_entry['link']))
+            job_entry['description_hash'] = description_hash(job_entry['description'])
+            job_entry['search_url'] = search_key
+            writer.add(job_entry)
+        with seen_lock:
+            jobs_data.extend(page_jobs)
+        return len(page_jobs)
+
+    try:
+        page_urls = [(page, get_page_url(url, page)) for page in range(1, pages + 1)]
+        with tqdm(total=pages) as progress:
+            results = browser_pool.crawl(page_urls, process_page, progress, stop_when if watermark else None, worker_ids)
+        pages_saved = pages - len(results) if crawl_state['stop_page'] is not None else 0
+        last_new_page = max((page for page, new_jobs in results.items() if new_jobs), default=0)
+        if crawl_state['stop_page'] is not None:
+            print(f"Incremental crawl: stopped after page {crawl_state['stop_page']}, {len(results)} of {pages} pages crawled, "
+                  f"{pages_saved} pages saved (last page with new jobs: {last_new_page or 'none'}).")
+        if crawl_state['head_key'] is not None:
+            save_crawl_watermark(search_key, crawl_state['head_key'], last_new_page, len(results), pages_saved, db_path)
+    finally:
+        if own_writer:
+            writer.close()
+        if own_pool:
+            browser_pool.close()
+    if report_timings:
+        print("Page timings:")
+        timings.summary()
+        timings.save()
+    return pd.DataFrame(jobs_data)
+
+
+def scrape_stepstone_searches(urls, pages=30, db_path="data/jobs.db", detail_fetcher=None, browser_pool=None, recorder=None, writer=None,
+                              incremental_stop_pages=0, search_keys=None, throttle=None):
+    """
+    Crawl several Stepstone searches at the same time on one browser pool.
+
+    The pool's workers are split between the searches (searches beyond the pool size wait for a
+    free worker). All searches share one JobWriter, so a job found by one search is skipped by
+    the others before its detail page is fetched, and one HostThrottle, so the searches together
+    stay within the per-host request budget. Every job is tagged with the search that found it.
+    search_keys: per search, the URL watermarks and tags are stored under (default: urls).
+    """
+    search_keys = search_keys or urls
+    own_pool = browser_pool is None
+    if own_pool:
+        browser_pool = BrowserPool(len(urls), initialize_driver, handle_cookies)
+    own_writer = writer is None
+    if own_writer:
+        writer = JobWriter(db_path)
+    timings = PageTimings()
+    # size // len(urls) workers per search never asks for more workers than the pool has, so a search never waits forever
+    workers_per_search = max(1, browser_pool.size // len(urls))
+    free_workers = queue.Queue()
+    for worker_id in range(browser_pool.size):
+        free_workers.put(worker_id)
+
+    def crawl_search(url, search_key):
+        worker_ids = [free_workers.get() for _ in range(workers_per_search)]
+        try:
+            print(f"Crawling search {search_key} with browser worker(s) {worker_ids}")
+            return scrape_jobs_from_stepstone(url, pages, db_path, detail_fetcher=detail_fetcher, browser_pool=browser_pool, timings=timings,
+                                              recorder=recorder, writer=writer, incremental_stop_pages=incremental_stop_pages,
+                                              search_key=search_key, throttle=throttle, worker_ids=worker_ids, report_timings=False)
+        finally:
+            for worker_id in worker_ids:
+                free_workers.put(worker_id)
+
+    try:
+        with ThreadPoolExecutor(max_workers=min(len(urls), browser_pool.size)) as executor:
+            frames = list(executor.map(crawl_search, urls, search_keys))
+    finally:
+        if own_writer:
+            writer.close()
+        if own_pool:
+            browser_pool.close()
+    for search_key, jobs_df in zip(search_keys, frames):
+        print(f"{search_key}: {len(jobs_df)} new jobs")
+    print("Page timings:")
+    timings.summary()
+    timings.save()
+    return pd.concat(frames, ignore_index=True)
+
+
+def scrape_jobs_from_indeed(url, pages=1):
+    driver = initialize_driver()
+    driver.get(url)
+    handle_cookies(driver)
+
+    jobs_data = []
+    for _ in tqdm(range(pages)):
+        close_popup_if_present(driver)
+        wait_for_page_ready(driver, 'div.css-dekpa.e37uo190', timeout=10)
+        job_cards = driver.find_elements(By.CSS_SELECTOR, 'div.css-dekpa.e37uo190')
+        for job_card in job_cards:
+            title_element = job_card.find_element(By.CSS_SELECTOR,
+                                                  'h2.jobTitle.css-14z7akl.eu4oa1w0 a.jcs-JobTitle.css-jspxzf.eu4oa1w0')
+            title = title_element.text
+            job_link = title_element.get_attribute('href')
+            if job_link.startswith("/"):
+                job_link = "https://de.indeed.com" + job_link
+            jobs_data.append({'title': title, 'description': "", 'link': job_link})
+
+        try:
+            current_url = driver.current_url
+            next_page_btn = WebDriverWait(driver, 10).until(
+                EC.element_to_be_clickable((By.XPATH, '//a[@aria-label="Next Page"]'))
+            )
+            next_page_btn.click()
+            WebDriverWait(driver, 10).until(lambda driver: driver.current_url != current_url)
+        except Exception as e:
+            print("Error: Navigating to next page failed or last page reached:", str(e))
+            break
+
+    driver.quit()
+    return pd.DataFrame(jobs_data)
+
+
+def close_popup_if_present(driver):
+    try:
+        # Wait for the popup to appear. Adjust the timeout as needed.
+        WebDriverWait(driver, 5).until(
+            EC.visibility_of_element_located((By.ID, "mosaic-desktopserpjapopup"))
+        )
+        # Look for the close button within the popup and click it.
+        close_btn = driver.find_element(By.CSS_SELECTOR, 'button[aria-label="schließen"]')
+        close_btn.click()
+        print("Popup closed successfully.")
+    except (TimeoutException, NoSuchElementException):
+        # If the popup doesn't appear or the close button is not found, just continue.
+        pass
@@ -0,0 +1,25 @@
+import re
+import unicodedata
+
+# Text normalization shared by the duplicate check (ingest.py, near_dup.py), the title
+# pre-filter and the relevance ranker. Standard library only, so every module can import it.
+
+# German umlauts spelled out, so "Entwickler für Büro" and "fuer buero" match
+UMLAUTS = str.maketrans({'ä': 'ae', 'ö': 'oe', 'ü': 'ue', 'ß': 'ss'})
+
+# Gender tags that only differ in order or spelling between reposts: (m/w/d), (w/m/d), (all genders), ...
+GENDER_TAG_PATTERN = re.compile(r"\((?:[mwfdx]\s*[/|,]\s*)+[mwfdx]\)|\(all genders?\)|\(gn\)", re.IGNORECASE)
+
+
+def dedup_key(title, company):
+    """
+    Normalized title+company key used to recognize a job that is already in the database:
+    case, whitespace, punctuation and gender tags do not matter. "+" and "#" are kept, so
+    "C++", "C#" and "C" jobs stay apart.
+    """
+    parts = []
+    for text in (title, company):
+        text = unicodedata.normalize('NFKC', text or '').casefold()
+        text = GENDER_TAG_PATTERN.sub(' ', text)
+        parts.append(" ".join(re.findall(r"[\w+#]+", text)))
+    return "|".join(parts)